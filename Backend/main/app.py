@@ -1,13 +1,28 @@
 # main/app.py
 import asyncio
+import calendar
+import gzip
+import hashlib
+import ipaddress
 import json
+import logging
 import os
 import re
+import socket
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Tuple
+from urllib.parse import urljoin, urlparse
+from typing import List, Optional, Dict, Any, Tuple, Iterable, AsyncIterator
 from math import ceil
+from itertools import islice
+from collections import deque, OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import httpx
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 
 # -------------------------
@@ -19,10 +34,45 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 LANG_FILE = os.path.join(DATA_DIR, "languages.json")
 COUNTRY_FILE = os.path.join(DATA_DIR, "countries.json")
+PLAYLIST_INDEX_FILE = os.path.join(DATA_DIR, "playlist_index.json")
+LOGO_CACHE_DIR = os.path.join(DATA_DIR, "logos")
+EPG_CACHE_DIR = os.path.join(DATA_DIR, "epg")
 CHANNEL_INDEX_URL = "https://iptv-org.github.io/iptv/index.m3u"
 CHANNEL_CACHE_TTL = timedelta(minutes=30)   # how long channel list + validation is considered fresh
 CHANNEL_VALIDATE_CONCURRENCY = 10           # concurrent requests when validating streams
+PROBE_CONCURRENCY = 20                      # process-wide concurrent probes for request-triggered validation
+PROBE_MAX_PENDING = 200                     # probes queued or running before new ones are shed
+PROBE_REQUEST_DEADLINE = 5.0                # seconds a request waits for its probes before using cached state
+PLAYLIST_CRAWL_TTL = timedelta(hours=6)     # how long the crawled country/language playlists are considered fresh
+PLAYLIST_CRAWL_CONCURRENCY = 8              # concurrent playlist downloads while crawling
 HTTP_TIMEOUT = 12.0
+EXPORT_CHUNK_LINES = 500                    # lines buffered per chunk when streaming exports
+VALIDATION_EVENT_INTERVAL = 1.0             # seconds between coalesced validation event batches
+VALIDATION_EVENT_BUFFER = 256               # batches kept for SSE subscribers to catch up / resume
+SSE_KEEPALIVE_SECONDS = 15.0
+LOGO_CACHE_MAX_BYTES = 200 * 1024 * 1024    # disk budget for cached logos (LRU eviction above this)
+LOGO_MAX_BYTES = 2 * 1024 * 1024            # refuse logos larger than this
+LOGO_NEGATIVE_TTL = timedelta(hours=1)      # how long a failed logo fetch is remembered
+LOGO_FETCH_TIMEOUT = 8.0
+HLS_RELAY_ENABLED = os.getenv("HLS_RELAY_ENABLED", "0").lower() in ("1", "true", "yes")
+RELAY_PLAYLIST_TTL = 2.0                    # seconds a rewritten playlist is shared between viewers
+RELAY_PLAYLIST_MAX_BYTES = 1024 * 1024
+RELAY_SEGMENT_CACHE_BYTES = 256 * 1024 * 1024   # in-memory segment cache budget (LRU)
+RELAY_SEGMENT_MAX_BYTES = 16 * 1024 * 1024  # abort relaying anything larger (not a segment)
+RELAY_MAX_URLS = 100_000                    # relay tokens remembered (LRU)
+RELAY_ALLOW_PRIVATE_HOSTS = False           # relay loopback/private/link-local upstreams (never in production)
+RELAY_HOST_CHECK_TTL = 300.0                # seconds a host's public/non-public verdict is cached
+CPU_EXECUTOR_KIND = os.getenv("CPU_EXECUTOR", "thread").lower()   # "thread" or "process" for parsing / json writes
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "2"))
+LOOP_LAG_INTERVAL = 0.1                     # seconds between event-loop lag samples
+LOOP_LAG_THRESHOLD = 0.1                    # lag (seconds) above which a sample counts as a stall
+EPG_SOURCES = [src.strip() for src in os.getenv("EPG_SOURCES", "").split(",") if src.strip()]   # XMLTV paths or urls
+EPG_REFRESH_INTERVAL = timedelta(hours=6)
+EPG_KEEP_PAST = timedelta(hours=12)         # programmes that ended longer ago than this are dropped
+EPG_KEEP_FUTURE = timedelta(days=7)         # programmes starting later than this are not loaded
+EPG_DESC_MAX_CHARS = 300
+
+logger = logging.getLogger("iptv")
 
 app = FastAPI(title="IPTV Unified API (languages, countries, channels)")
 
@@ -75,6 +125,21 @@ class Country(BaseModel):
     cities: List[City] = []
 
 
+class Programme(BaseModel):
+    start: str
+    stop: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+
+
+class ChannelMirror(BaseModel):
+    url: str
+    working: Optional[bool] = None
+    hls_compatible: Optional[bool] = None
+    latency_ms: Optional[float] = None
+    last_checked: Optional[str] = None
+
+
 class Channel(BaseModel):
     id: Optional[str] = None
     name: Optional[str] = None
@@ -86,11 +151,29 @@ class Channel(BaseModel):
     country: Optional[str] = None
     url: Optional[str] = None
 
+    # same-origin cached logo (/api/v1/logos/{hash}); prefer this over tvg_logo in clients
+    logo_url: Optional[str] = None
+    # shared HLS relay playlist (only when HLS_RELAY_ENABLED and the stream validated as HLS)
+    relay_url: Optional[str] = None
+
+    # playlist membership (filled by the playlist crawler)
+    countries: Optional[List[str]] = None
+    subdivisions: Optional[List[str]] = None
+    cities: Optional[List[str]] = None
+    languages: Optional[List[str]] = None
+
     # validation metadata
     working: Optional[bool] = None
     hls_compatible: Optional[bool] = None
     last_checked: Optional[str] = None
     check_error: Optional[str] = None
+    latency_ms: Optional[float] = None
+
+    # other stream urls for the same channel, best first (only with group_mirrors=true)
+    mirrors: Optional[List[ChannelMirror]] = None
+
+    # current programme from the EPG (only with include_epg=true)
+    now_playing: Optional[Programme] = None
 
 
 # -------------------------
@@ -106,6 +189,166 @@ def _load_json_file(path: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def _write_json_file(path: str, data: Any, indent: Optional[int] = None) -> None:
+    text = json.dumps(data, indent=indent, ensure_ascii=False, separators=None if indent else (",", ":"))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+# -------------------------
+# Executors: CPU-bound stages (parsing, filtering, json writes) run off the event loop
+# -------------------------
+_executors: Dict[str, Optional[Executor]] = {
+    "cpu": None,              # CPU_EXECUTOR_KIND pool for picklable, self-contained work
+    "thread": None,           # thread pool for work that reads shared in-memory state
+}
+
+
+def _thread_executor() -> Executor:
+    if _executors["thread"] is None:
+        _executors["thread"] = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="iptv-cpu")
+    return _executors["thread"]
+
+
+def _cpu_executor() -> Executor:
+    if _executors["cpu"] is None:
+        if CPU_EXECUTOR_KIND == "process":
+            _executors["cpu"] = ProcessPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS)
+        else:
+            _executors["cpu"] = _thread_executor()
+    return _executors["cpu"]
+
+
+async def _run_cpu(fn, *args):
+    """Run a module-level function with picklable args/result in the configured CPU pool."""
+    return await asyncio.get_running_loop().run_in_executor(_cpu_executor(), fn, *args)
+
+
+async def _run_in_thread(fn, *args):
+    """Run fn in the thread pool (for work over shared in-memory data that must not be pickled)."""
+    return await asyncio.get_running_loop().run_in_executor(_thread_executor(), fn, *args)
+
+
+def _shutdown_executors() -> None:
+    for key, ex in list(_executors.items()):
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+        _executors[key] = None
+
+
+# -------------------------
+# Event-loop lag monitor: logs and counts stalls above LOOP_LAG_THRESHOLD
+# -------------------------
+_loop_lag: Dict[str, Any] = {
+    "samples": 0,
+    "stalls": 0,
+    "max_lag_ms": 0.0,
+    "last_stall_at": None,
+    "task": None,
+}
+
+
+async def _monitor_loop_lag() -> None:
+    while True:
+        expected = time.monotonic() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = time.monotonic() - expected
+        _loop_lag["samples"] += 1
+        if lag * 1000.0 > _loop_lag["max_lag_ms"]:
+            _loop_lag["max_lag_ms"] = round(lag * 1000.0, 1)
+        if lag > LOOP_LAG_THRESHOLD:
+            _loop_lag["stalls"] += 1
+            _loop_lag["last_stall_at"] = datetime.utcnow().isoformat()
+            logger.warning("event loop stalled for %.0f ms", lag * 1000.0)
+
+
+def parse_language_index(text: str) -> List[Dict]:
+    """Parse index.language.m3u (name / channels / playlist url rows) into language dicts."""
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    if lines and lines[0].lower().startswith("language"):
+        lines = lines[1:]
+    items = []
+    for ln in lines:
+        parts = [p.strip() for p in ln.split("\t") if p.strip()]
+        if len(parts) < 3:
+            parts = [p for p in re.split(r"\s{2,}", ln) if p]
+        if len(parts) >= 3:
+            name, channels_str, playlist = parts[0], parts[1], parts[2]
+            try:
+                channels = int(channels_str)
+            except Exception:
+                channels = None
+            code = None
+            try:
+                code = os.path.splitext(os.path.basename(playlist))[0]
+            except Exception:
+                code = None
+            items.append({"name": name, "channels": channels, "playlist_url": playlist, "code": code})
+    return items
+
+
+def _playlist_code(u: str) -> Optional[str]:
+    try:
+        return os.path.splitext(os.path.basename(u))[0]
+    except Exception:
+        return None
+
+
+def parse_country_index(text: str) -> List[Dict]:
+    """Parse index.country.m3u into country dicts with nested subdivisions and cities."""
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    items = []
+    current_country = None
+    current_subdivision = None
+    for ln in lines:
+        parts = [p for p in re.split(r"\t+|\s{2,}", ln) if p]
+        if len(parts) < 2:
+            m = re.search(r"(https?://\S+)$", ln)
+            if m:
+                url = m.group(1)
+                name = ln[:m.start()].strip()
+                parts = [name, url]
+        if len(parts) < 2:
+            continue
+        name, url = parts[0].strip(), parts[-1].strip()
+        url_lower = url.lower()
+        if "/countries/" in url_lower:
+            country = {"name": name, "playlist_url": url, "code": _playlist_code(url), "subdivisions": [], "cities": []}
+            items.append(country)
+            current_country = country
+            current_subdivision = None
+        elif "/subdivisions/" in url_lower:
+            if current_country is None:
+                current_country = {"name": "unknown", "playlist_url": None, "code": None, "subdivisions": [], "cities": []}
+                items.append(current_country)
+            subdivision = {"name": name, "playlist_url": url, "code": _playlist_code(url), "cities": []}
+            current_country["subdivisions"].append(subdivision)
+            current_subdivision = subdivision
+        elif "/cities/" in url_lower:
+            city = {"name": name, "playlist_url": url, "code": _playlist_code(url)}
+            if current_subdivision is not None:
+                current_subdivision["cities"].append(city)
+            elif current_country is not None:
+                current_country["cities"].append(city)
+            else:
+                unknown = {"name": "unknown", "playlist_url": None, "code": None, "subdivisions": [], "cities": [city]}
+                items.append(unknown)
+                current_country = unknown
+                current_subdivision = None
+        else:
+            # attach as country-level city/sub-item
+            city = {"name": name, "playlist_url": url, "code": _playlist_code(url)}
+            if current_subdivision:
+                current_subdivision["cities"].append(city)
+            elif current_country:
+                current_country["cities"].append(city)
+            else:
+                items.append({"name": name, "playlist_url": url, "code": _playlist_code(url), "subdivisions": [], "cities": []})
+                current_country = items[-1]
+                current_subdivision = None
+    return items
+
+
 # -------------------------
 # Languages: read from languages.json (or fallback to remote if requested)
 # -------------------------
@@ -114,37 +357,16 @@ async def _read_or_fetch_languages(force: bool = False) -> List[Dict]:
     file_data = _load_json_file(LANG_FILE)
     if file_data and not force:
         return file_data.get("items", [])
-    # fallback: fetch remote and parse quickly (only if force=True)
+    # fallback: fetch remote and parse (only if force=True)
     if force:
         async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
             r = await client.get("https://iptv-org.github.io/iptv/index.language.m3u")
             r.raise_for_status()
             text = r.text
-        # quick parse (similar to previous parse_index_text)
-        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-        if lines and lines[0].lower().startswith("language"):
-            lines = lines[1:]
-        items = []
-        for ln in lines:
-            parts = [p.strip() for p in ln.split("\t") if p.strip()]
-            if len(parts) < 3:
-                parts = [p for p in re.split(r"\s{2,}", ln) if p]
-            if len(parts) >= 3:
-                name, channels_str, playlist = parts[0], parts[1], parts[2]
-                try:
-                    channels = int(channels_str)
-                except Exception:
-                    channels = None
-                code = None
-                try:
-                    code = os.path.splitext(os.path.basename(playlist))[0]
-                except Exception:
-                    code = None
-                items.append({"name": name, "channels": channels, "playlist_url": playlist, "code": code})
+        items = await _run_cpu(parse_language_index, text)
         # save to file for future
         try:
-            with open(LANG_FILE, "w", encoding="utf-8") as f:
-                json.dump({"updated_at": datetime.utcnow().isoformat(), "items": items}, f, indent=2, ensure_ascii=False)
+            await _run_cpu(_write_json_file, LANG_FILE, {"updated_at": datetime.utcnow().isoformat(), "items": items}, 2)
         except Exception:
             pass
         return items
@@ -158,71 +380,15 @@ async def _read_or_fetch_countries(force: bool = False) -> List[Dict]:
     file_data = _load_json_file(COUNTRY_FILE)
     if file_data and not force:
         return file_data.get("items", [])
-    # If forced, fetch remote and parse (same logic as previous parse_country_index)
+    # If forced, fetch remote and parse (see parse_country_index)
     if force:
         async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
             r = await client.get("https://iptv-org.github.io/iptv/index.country.m3u")
             r.raise_for_status()
             text = r.text
-        # reuse parsing strategy from previous code (simplified)
-        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-        items = []
-        current_country = None
-        current_subdivision = None
-        for ln in lines:
-            parts = [p for p in re.split(r"\t+|\s{2,}", ln) if p]
-            if len(parts) < 2:
-                m = re.search(r"(https?://\S+)$", ln)
-                if m:
-                    url = m.group(1)
-                    name = ln[:m.start()].strip()
-                    parts = [name, url]
-            if len(parts) < 2:
-                continue
-            name, url = parts[0].strip(), parts[-1].strip()
-            url_lower = url.lower()
-            def _code(u: str) -> Optional[str]:
-                try:
-                    return os.path.splitext(os.path.basename(u))[0]
-                except Exception:
-                    return None
-            if "/countries/" in url_lower:
-                country = {"name": name, "playlist_url": url, "code": _code(url), "subdivisions": [], "cities": []}
-                items.append(country)
-                current_country = country
-                current_subdivision = None
-            elif "/subdivisions/" in url_lower:
-                if current_country is None:
-                    current_country = {"name": "unknown", "playlist_url": None, "code": None, "subdivisions": [], "cities": []}
-                    items.append(current_country)
-                subdivision = {"name": name, "playlist_url": url, "code": _code(url), "cities": []}
-                current_country["subdivisions"].append(subdivision)
-                current_subdivision = subdivision
-            elif "/cities/" in url_lower:
-                city = {"name": name, "playlist_url": url, "code": _code(url)}
-                if current_subdivision is not None:
-                    current_subdivision["cities"].append(city)
-                elif current_country is not None:
-                    current_country["cities"].append(city)
-                else:
-                    unknown = {"name": "unknown", "playlist_url": None, "code": None, "subdivisions": [], "cities": [city]}
-                    items.append(unknown)
-                    current_country = unknown
-                    current_subdivision = None
-            else:
-                # attach as country-level city/sub-item
-                city = {"name": name, "playlist_url": url, "code": _code(url)}
-                if current_subdivision:
-                    current_subdivision["cities"].append(city)
-                elif current_country:
-                    current_country["cities"].append(city)
-                else:
-                    items.append({"name": name, "playlist_url": url, "code": _code(url), "subdivisions": [], "cities": []})
-                    current_country = items[-1]
-                    current_subdivision = None
+        items = await _run_cpu(parse_country_index, text)
         try:
-            with open(COUNTRY_FILE, "w", encoding="utf-8") as f:
-                json.dump({"updated_at": datetime.utcnow().isoformat(), "items": items}, f, indent=2, ensure_ascii=False)
+            await _run_cpu(_write_json_file, COUNTRY_FILE, {"updated_at": datetime.utcnow().isoformat(), "items": items}, 2)
         except Exception:
             pass
         return items
@@ -284,7 +450,11 @@ async def _fetch_text(url: str) -> str:
 # -------------------------
 # in-memory cache for channels + validation metadata
 _channels_cache: Dict[str, Any] = {
-    "items": None,            # List[Dict] parsed channels
+    "items": None,            # List[Dict] parsed channels (merged with crawled playlists)
+    "master": None,           # List[Dict] channels as parsed from index.m3u
+    "by_url": {},             # stream url -> channel dict in "items"
+    "mirror_groups": {},      # mirror key (tvg-id or normalized name) -> channel dicts sharing it
+    "mirror_best": {},        # mirror key -> url of the best-ranked mirror
     "last_loaded": None,      # datetime
     "validated_map": {},      # url -> validation result dict
     "lock": asyncio.Lock()
@@ -338,6 +508,7 @@ def parse_m3u_index(text: str) -> List[Dict]:
                     "language": attrs.get("tvg-language") or attrs.get("language") or None,
                     "country": attrs.get("tvg-country") or attrs.get("country") or None,
                     "url": url,
+                    "extinf_attrs": (m.group(1) or "").strip() if m else "",
                 }
                 items.append(item)
                 i = j  # advance to URL line index; loop will i+=1 later
@@ -358,18 +529,419 @@ async def _fetch_channel_index_text() -> str:
 async def _load_channels(force: bool = False) -> List[Dict]:
     """
     Load/parse channel index with caching. If cached and not expired, return cached items.
+    While a refresh is in progress, other callers keep getting the previous items instead
+    of queueing behind the download + parse.
     """
+    if not force and _channels_cache["items"] is not None and _channels_cache["last_loaded"]:
+        fresh = datetime.utcnow() - _channels_cache["last_loaded"] < CHANNEL_CACHE_TTL
+        if fresh or _channels_cache["lock"].locked():
+            return _channels_cache["items"]
     async with _channels_cache["lock"]:
         if _channels_cache["items"] and _channels_cache["last_loaded"]:
             if not force and (datetime.utcnow() - _channels_cache["last_loaded"] < CHANNEL_CACHE_TTL):
                 return _channels_cache["items"]
-        # fetch & parse
+        # fetch & parse (parse runs off the event loop)
         text = await _fetch_channel_index_text()
-        parsed = parse_m3u_index(text)
-        _channels_cache["items"] = parsed
+        parsed = await _run_cpu(parse_m3u_index, text)
+        _channels_cache["master"] = parsed
         _channels_cache["last_loaded"] = datetime.utcnow()
+        _merge_playlist_index()
         # keep validated_map but don't clear so we keep previous validation results
-        return parsed
+        return _channels_cache["items"]
+
+
+# -------------------------
+# Playlist crawler: country/subdivision/city/language playlists merged into the master index
+# -------------------------
+_MEMBERSHIP_KEYS = {
+    "language": "languages",
+    "country": "countries",
+    "subdivision": "subdivisions",
+    "city": "cities",
+}
+
+_playlist_index: Dict[str, Any] = {
+    "playlists": {},          # playlist url -> {type, code, etag, last_modified, urls: [stream url], fetched_at}
+    "streams": {},            # stream url -> parsed channel dict (first playlist it was seen in)
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "total": 0,
+    "fetched": 0,
+    "not_modified": 0,
+    "errors": 0,
+    "lock": asyncio.Lock()
+}
+
+
+def _load_playlist_index_file() -> None:
+    data = _load_json_file(PLAYLIST_INDEX_FILE)
+    if not data:
+        return
+    _playlist_index["playlists"] = data.get("playlists") or {}
+    _playlist_index["streams"] = data.get("streams") or {}
+    _playlist_index["finished_at"] = data.get("updated_at")
+
+
+async def _save_playlist_index_file() -> None:
+    try:
+        await _run_cpu(_write_json_file, PLAYLIST_INDEX_FILE, {
+            "updated_at": _playlist_index["finished_at"],
+            "playlists": _playlist_index["playlists"],
+            "streams": _playlist_index["streams"],
+        })
+    except Exception:
+        pass
+
+
+async def _known_playlists() -> List[Dict[str, str]]:
+    """
+    Every playlist listed in languages.json and countries.json, including
+    subdivisions and cities (both country-level and subdivision-level).
+    Returns dicts: { type, code, url }
+    """
+    out: List[Dict[str, str]] = []
+
+    def _add(t: str, it: Dict) -> None:
+        url = it.get("playlist_url")
+        if url:
+            out.append({"type": t, "code": (it.get("code") or "").lower(), "url": url})
+
+    for it in await _read_or_fetch_languages():
+        _add("language", it)
+    for c in await _read_or_fetch_countries():
+        _add("country", c)
+        for city in (c.get("cities") or []):
+            _add("city", city)
+        for s in (c.get("subdivisions") or []):
+            _add("subdivision", s)
+            for city in (s.get("cities") or []):
+                _add("city", city)
+    return out
+
+
+def _merge_playlist_index() -> None:
+    """
+    Join crawled playlist membership into the master channel set by stream url.
+    Each channel gets countries/subdivisions/cities/languages lists; streams that only
+    appear in a sub-playlist are appended to the channel set. Rebuilds _channels_cache['items']
+    and _channels_cache['by_url'].
+    """
+    master = _channels_cache["master"] or []
+    playlists = _playlist_index["playlists"]
+    streams = _playlist_index["streams"]
+
+    items: List[Dict] = []
+    by_url: Dict[str, Dict] = {}
+    for it in master:
+        for key in _MEMBERSHIP_KEYS.values():
+            it[key] = []
+        items.append(it)
+        url = it.get("url")
+        if url and url not in by_url:
+            by_url[url] = it
+
+    for pl in playlists.values():
+        key = _MEMBERSHIP_KEYS.get(pl.get("type"))
+        code = pl.get("code")
+        if not key or not code:
+            continue
+        for url in pl.get("urls") or []:
+            it = by_url.get(url)
+            if it is None:
+                src = streams.get(url)
+                if not src:
+                    continue
+                it = dict(src)
+                for k in _MEMBERSHIP_KEYS.values():
+                    it[k] = []
+                items.append(it)
+                by_url[url] = it
+            if code not in it[key]:
+                it[key].append(code)
+
+    # fill the single-valued fields so text search / UI keep working as before
+    for it in items:
+        if not it.get("language") and it.get("languages"):
+            it["language"] = it["languages"][0]
+        if not it.get("country") and it.get("countries"):
+            it["country"] = it["countries"][0]
+
+    _channels_cache["items"] = items
+    _channels_cache["by_url"] = by_url
+    _index_mirrors(items)
+
+
+# -------------------------
+# Mirrors: entries sharing a tvg-id (or normalized name) are the same channel
+# -------------------------
+MIRROR_NAME_NOISE_RE = re.compile(r"\(.*?\)|\[.*?\]|\b(?:hd|fhd|uhd|sd|4k|\d{3,4}[pi])\b")
+
+
+def _mirror_key(it: Dict) -> Optional[str]:
+    tvg_id = (it.get("tvg_id") or "").strip().lower()
+    if tvg_id:
+        return tvg_id
+    name = MIRROR_NAME_NOISE_RE.sub(" ", (it.get("name") or "").lower())
+    name = re.sub(r"[\W_]+", "", name)
+    return f"name:{name}" if name else None
+
+
+def _item_mirror_key(it: Dict) -> Optional[str]:
+    """Mirror key stored on the item by _index_mirrors; computed for items outside the index."""
+    return it["mirror_key"] if "mirror_key" in it else _mirror_key(it)
+
+
+def _mirror_rank(it: Dict) -> Tuple[int, int, float]:
+    """Sort key: working before unchecked before dead, then HLS compatible, then probe latency."""
+    vald = _channels_cache["validated_map"].get(it.get("url"))
+    if not vald:
+        return (1, 1, float("inf"))
+    state = 0 if vald.get("working") else 2
+    hls = 0 if vald.get("hls_compatible") else 1
+    latency = vald.get("latency_ms")
+    return (state, hls, latency if latency is not None else float("inf"))
+
+
+def _rank_mirrors(mirrors: List[Dict]) -> List[Dict]:
+    return sorted(mirrors, key=_mirror_rank)
+
+
+def _index_mirrors(items: List[Dict]) -> None:
+    groups: Dict[str, List[Dict]] = {}
+    for it in items:
+        key = it["mirror_key"] = _mirror_key(it)
+        if key and it.get("url"):
+            groups.setdefault(key, []).append(it)
+    _channels_cache["mirror_groups"] = groups
+    _channels_cache["mirror_best"] = {key: _rank_mirrors(ms)[0]["url"] for key, ms in groups.items()}
+
+
+def _update_mirror_best(url: str) -> None:
+    """Re-rank the (small) mirror group of url after its validation state changed."""
+    it = _channels_cache["by_url"].get(url)
+    key = _item_mirror_key(it) if it else None
+    group = _channels_cache["mirror_groups"].get(key) if key else None
+    if group:
+        _channels_cache["mirror_best"][key] = _rank_mirrors(group)[0]["url"]
+
+
+def _mirrors_of(it: Dict) -> List[Dict]:
+    key = _item_mirror_key(it)
+    if not key:
+        return [it]
+    return _channels_cache["mirror_groups"].get(key) or [it]
+
+
+def _collapse_mirrors(items: Iterable[Dict]) -> Iterable[Dict]:
+    """Yield only the first entry of each mirror group, keeping index order."""
+    seen = set()
+    for it in items:
+        key = _item_mirror_key(it)
+        if key:
+            if key in seen:
+                continue
+            seen.add(key)
+        yield it
+
+
+async def _crawl_playlist(pl: Dict[str, str], client: httpx.AsyncClient, sem: asyncio.Semaphore) -> None:
+    """
+    Fetch a single playlist with a conditional request (ETag / Last-Modified) and
+    record its stream urls in _playlist_index. A 304 keeps the previous entry.
+    """
+    url = pl["url"]
+    prev = _playlist_index["playlists"].get(url)
+    headers = {}
+    if prev:
+        if prev.get("etag"):
+            headers["If-None-Match"] = prev["etag"]
+        if prev.get("last_modified"):
+            headers["If-Modified-Since"] = prev["last_modified"]
+
+    async with sem:
+        r = await client.get(url, headers=headers, follow_redirects=True)
+
+    now = datetime.utcnow().isoformat()
+    if r.status_code == 304 and prev:
+        prev["fetched_at"] = now
+        _playlist_index["not_modified"] += 1
+        return
+    r.raise_for_status()
+
+    parsed = await _run_cpu(parse_m3u_index, r.text)
+    streams = _playlist_index["streams"]
+    urls = []
+    for it in parsed:
+        u = it.get("url")
+        if not u:
+            continue
+        urls.append(u)
+        if u not in streams:
+            streams[u] = it
+    _playlist_index["playlists"][url] = {
+        "type": pl["type"],
+        "code": pl["code"],
+        "etag": r.headers.get("etag"),
+        "last_modified": r.headers.get("last-modified"),
+        "urls": urls,
+        "fetched_at": now,
+    }
+    _playlist_index["fetched"] += 1
+
+
+async def crawl_playlists() -> None:
+    """
+    Crawl every known country/subdivision/city/language playlist and merge the
+    result into the channel cache. Intended to run as a background task.
+    """
+    async with _playlist_index["lock"]:
+        if _playlist_index["running"]:
+            return
+        _playlist_index["running"] = True
+        _playlist_index["started_at"] = datetime.utcnow().isoformat()
+        _playlist_index["total"] = 0
+        _playlist_index["fetched"] = 0
+        _playlist_index["not_modified"] = 0
+        _playlist_index["errors"] = 0
+
+    try:
+        playlists = await _known_playlists()
+        _playlist_index["total"] = len(playlists)
+        sem = asyncio.Semaphore(PLAYLIST_CRAWL_CONCURRENCY)
+        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
+            results = await asyncio.gather(
+                *(_crawl_playlist(pl, client, sem) for pl in playlists),
+                return_exceptions=True,
+            )
+        _playlist_index["errors"] = sum(1 for r in results if isinstance(r, Exception))
+
+        # drop playlists no longer listed, and streams no playlist references
+        listed = {pl["url"] for pl in playlists}
+        for url in list(_playlist_index["playlists"]):
+            if url not in listed:
+                del _playlist_index["playlists"][url]
+        referenced = {u for pl in _playlist_index["playlists"].values() for u in pl.get("urls") or []}
+        for u in list(_playlist_index["streams"]):
+            if u not in referenced:
+                del _playlist_index["streams"][u]
+
+        _playlist_index["finished_at"] = datetime.utcnow().isoformat()
+        await _save_playlist_index_file()
+        if _channels_cache["master"] is not None:
+            _merge_playlist_index()
+    finally:
+        _playlist_index["running"] = False
+
+
+def _playlist_index_is_stale() -> bool:
+    finished = _playlist_index["finished_at"]
+    if not finished:
+        return True
+    try:
+        return datetime.utcnow() - datetime.fromisoformat(finished.rstrip("Z")) >= PLAYLIST_CRAWL_TTL
+    except Exception:
+        return True
+
+
+def _schedule_playlist_crawl_if_stale() -> None:
+    if _playlist_index_is_stale() and not _playlist_index["running"]:
+        asyncio.create_task(crawl_playlists())
+
+
+def _local_playlist_items(special: Dict[str, Any]) -> Optional[Iterable[Dict]]:
+    """
+    Serve a resolved language/country/subdivision/city query from the crawled index.
+    Returns None when that playlist has not been crawled yet (caller falls back to a live fetch).
+    """
+    pl = _playlist_index["playlists"].get(special.get("url") or "")
+    if pl is None or _channels_cache["items"] is None:
+        return None
+    by_url = _channels_cache["by_url"]
+    return (by_url[u] for u in pl.get("urls") or [] if u in by_url)
+
+
+# -------------------------
+# Validation events: coalesced state transitions fanned out to SSE subscribers
+# -------------------------
+_validation_events: Dict[str, Any] = {
+    "seq": 0,                                           # id of the last published batch
+    "buffer": deque(maxlen=VALIDATION_EVENT_BUFFER),    # (seq, pre-rendered SSE text)
+    "pending": {},                                      # url -> transition, coalesced until next flush
+    "last_progress": None,                              # last published progress snapshot
+    "wakeup": None,                                     # asyncio.Event replaced on each publish
+    "flusher": None,                                    # background flush task
+}
+
+
+def _record_validation(url: str, res: Dict) -> None:
+    """
+    Store a validation result and queue a transition event if working / hls flags changed.
+    Only touches dicts, so the validator is never slowed down by subscribers.
+    """
+    prev = _channels_cache["validated_map"].get(url)
+    _channels_cache["validated_map"][url] = res
+    _update_mirror_best(url)
+    prev_working = prev.get("working") if prev else None
+    prev_hls = prev.get("hls_compatible") if prev else None
+    if prev_working == res.get("working") and prev_hls == res.get("hls_compatible"):
+        return
+    pending = _validation_events["pending"]
+    first = pending.get(url)
+    pending[url] = {
+        "url": url,
+        "working": res.get("working"),
+        "hls_compatible": res.get("hls_compatible"),
+        # keep the state from before the first change in this interval
+        "prev_working": first["prev_working"] if first else prev_working,
+        "prev_hls_compatible": first["prev_hls_compatible"] if first else prev_hls,
+    }
+    _ensure_validation_event_flusher()
+
+
+def _render_sse(seq: Optional[int], event: str, data: Any) -> str:
+    # seq=None omits the id line, so the client's Last-Event-ID is left unchanged
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _publish_validation_batch() -> None:
+    """Render pending transitions + a progress tick once, into the shared fan-out buffer."""
+    changes = [c for c in _validation_events["pending"].values()
+               if c["working"] != c["prev_working"] or c["hls_compatible"] != c["prev_hls_compatible"]]
+    _validation_events["pending"] = {}
+    progress = _validation_snapshot()
+    if not changes and progress == _validation_events["last_progress"]:
+        return
+    _validation_events["last_progress"] = progress
+    seq = _validation_events["seq"] + 1
+    text = _render_sse(seq, "progress", progress)
+    if changes:
+        text += _render_sse(seq, "changes", changes)
+    _validation_events["buffer"].append((seq, text))
+    _validation_events["seq"] = seq
+    wakeup = _validation_events["wakeup"]
+    _validation_events["wakeup"] = asyncio.Event()
+    if wakeup is not None:
+        wakeup.set()
+
+
+async def _validation_event_flusher() -> None:
+    try:
+        while True:
+            await asyncio.sleep(VALIDATION_EVENT_INTERVAL)
+            _publish_validation_batch()
+            if not _validation_events["pending"] and not _validation_job["running"]:
+                # publish the final tick (finished_at) and stop until the next run
+                _publish_validation_batch()
+                break
+    finally:
+        _validation_events["flusher"] = None
+
+
+def _ensure_validation_event_flusher() -> None:
+    if _validation_events["flusher"] is None:
+        _validation_events["flusher"] = asyncio.create_task(_validation_event_flusher())
 
 
 # Validation helpers
@@ -451,11 +1023,13 @@ async def validate_channel_entry(entry: Dict, client: httpx.AsyncClient, sem: as
         return result
 
     async with sem:
+        started = time.monotonic()
         try:
             status, headers, sample = await _head_or_get(url, client)
         except Exception as e:
             result["check_error"] = f"fetch error: {e}"
             return result
+        result["latency_ms"] = round((time.monotonic() - started) * 1000.0, 1)
 
     result["last_checked"] = datetime.utcnow().isoformat()
     if not status or status >= 400:
@@ -473,50 +1047,80 @@ async def validate_channel_entry(entry: Dict, client: httpx.AsyncClient, sem: as
     return result
 
 
-async def validate_channels_for_list(entries: List[Dict]) -> None:
+# -------------------------
+# Probe coordinator: request-path validation shares one in-flight probe per url
+# and a process-wide concurrency / queue budget
+# -------------------------
+_probe_coordinator: Dict[str, Any] = {
+    "inflight": {},           # url -> asyncio.Task shared by every caller waiting on that url
+    "sem": asyncio.Semaphore(PROBE_CONCURRENCY),
+    "client": None,           # shared httpx client for request-path probes
+    "admitted": 0,
+    "joined": 0,
+    "shed": 0,
+    "deadline_exceeded": 0,
+}
+
+
+def _probe_client() -> httpx.AsyncClient:
+    if _probe_coordinator["client"] is None:
+        _probe_coordinator["client"] = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+    return _probe_coordinator["client"]
+
+
+async def _probe(entry: Dict) -> None:
+    url = entry["url"]
+    try:
+        res = await validate_channel_entry(entry, _probe_client(), _probe_coordinator["sem"])
+    except Exception as e:
+        res = {"working": False, "hls_compatible": False, "last_checked": datetime.utcnow().isoformat(), "check_error": str(e)}
+    _record_validation(url, res)
+
+
+def _is_validation_fresh(url: str, now: datetime) -> bool:
+    prev = _channels_cache["validated_map"].get(url)
+    if prev and prev.get("last_checked"):
+        try:
+            return now - datetime.fromisoformat(prev["last_checked"]) < CHANNEL_CACHE_TTL
+        except Exception:
+            pass
+    return False
+
+
+async def validate_channels_for_list(entries: List[Dict], deadline: Optional[float] = None) -> None:
     """
     Validate a list of channel dicts (in-place update of _channels_cache['validated_map']).
     Only validates those entries whose url is not already validated or whose last check is stale.
+    Urls already being probed are joined instead of probed again; once PROBE_MAX_PENDING probes
+    are queued, further urls are shed (callers keep the cached state). Waits at most `deadline`
+    seconds (PROBE_REQUEST_DEADLINE by default) — probes still running afterwards finish in
+    background and update the cache.
     """
-    sem = asyncio.Semaphore(CHANNEL_VALIDATE_CONCURRENCY)
-    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as client:
-        tasks = []
-        now = datetime.utcnow()
-        for e in entries:
-            url = e.get("url")
-            if not url:
-                continue
-            prev = _channels_cache["validated_map"].get(url)
-            # if previously validated recently, skip
-            if prev and "last_checked" in prev:
-                try:
-                    last = datetime.fromisoformat(prev["last_checked"])
-                    if now - last < CHANNEL_CACHE_TTL:
-                        continue
-                except Exception:
-                    pass
-            tasks.append(validate_channel_entry(e, client, sem))
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            # attach results to map in same order by url
-            idx = 0
-            for e in entries:
-                url = e.get("url")
-                if not url:
-                    continue
-                # we may have skipped some, so check
-                res = None
-                if idx < len(results):
-                    candidate = results[idx]
-                    # if candidate is exception, convert to error
-                    if isinstance(candidate, Exception):
-                        res = {"working": False, "hls_compatible": False, "last_checked": datetime.utcnow().isoformat(), "check_error": str(candidate)}
-                    else:
-                        res = candidate
-                    idx += 1
-                else:
-                    continue
-                _channels_cache["validated_map"][url] = res
+    if deadline is None:
+        deadline = PROBE_REQUEST_DEADLINE
+    inflight = _probe_coordinator["inflight"]
+    now = datetime.utcnow()
+    waits = []
+    for e in entries:
+        url = e.get("url")
+        if not url or _is_validation_fresh(url, now):
+            continue
+        task = inflight.get(url)
+        if task is not None:
+            _probe_coordinator["joined"] += 1
+        elif len(inflight) >= PROBE_MAX_PENDING:
+            _probe_coordinator["shed"] += 1
+            continue
+        else:
+            task = asyncio.create_task(_probe(e))
+            inflight[url] = task
+            task.add_done_callback(lambda _t, u=url: inflight.pop(u, None))
+            _probe_coordinator["admitted"] += 1
+        waits.append(task)
+    if waits:
+        _, pending = await asyncio.wait(set(waits), timeout=deadline)
+        if pending:
+            _probe_coordinator["deadline_exceeded"] += 1
 
 
 # -------------------------
@@ -550,6 +1154,7 @@ async def validate_all_channels(force_refresh: bool = False):
         _validation_job["validated"] = 0
         _validation_job["errors"] = 0
         _validation_job["progress"] = 0.0
+    _ensure_validation_event_flusher()
 
     try:
         # optionally refresh channels list
@@ -584,10 +1189,10 @@ async def validate_all_channels(force_refresh: bool = False):
                     ent = slice_items[i] if i < len(slice_items) else None
                     url = ent.get("url") if ent else None
                     if isinstance(res, Exception):
-                        _channels_cache["validated_map"][url] = {"working": False, "hls_compatible": False, "last_checked": datetime.utcnow().isoformat(), "check_error": str(res)}
+                        _record_validation(url, {"working": False, "hls_compatible": False, "last_checked": datetime.utcnow().isoformat(), "check_error": str(res)})
                         _validation_job["errors"] += 1
                     else:
-                        _channels_cache["validated_map"][url] = res
+                        _record_validation(url, res)
                         if res.get("working"):
                             _validation_job["validated"] += 1
                     _validation_job["progress"] = (len(_channels_cache["validated_map"]) / _validation_job["total"]) * 100.0
@@ -609,9 +1214,7 @@ async def trigger_validate_all(force_refresh: bool = Query(False, description="F
 
 
 # Endpoint to inspect validation job status
-@app.get("/api/v1/channels/validate-status")
-async def validate_status():
-    # basic snapshot
+def _validation_snapshot() -> Dict[str, Any]:
     return {
         "running": _validation_job["running"],
         "started_at": _validation_job["started_at"],
@@ -623,6 +1226,798 @@ async def validate_status():
         "validated_map_size": len(_channels_cache["validated_map"]),
     }
 
+
+@app.get("/api/v1/channels/validate-status")
+async def validate_status():
+    # basic snapshot
+    return _validation_snapshot()
+
+
+async def _validation_event_stream(request: Request, last_seq: int) -> AsyncIterator[str]:
+    # initial snapshot so a fresh client does not need to poll validate-status; sent without an
+    # id so a client that drops before the replay below still resumes from last_seq
+    yield _render_sse(None, "progress", _validation_snapshot())
+    while True:
+        buffer = _validation_events["buffer"]
+        if buffer and last_seq < buffer[0][0] - 1:
+            # fell behind the fan-out buffer: tell the client to re-list
+            yield _render_sse(buffer[0][0] - 1, "reset", {"reason": "missed events"})
+            last_seq = buffer[0][0] - 1
+        for seq, text in list(buffer):
+            if seq > last_seq:
+                yield text
+                last_seq = seq
+        if _validation_events["wakeup"] is None:
+            _validation_events["wakeup"] = asyncio.Event()
+        wakeup = _validation_events["wakeup"]
+        if _validation_events["seq"] > last_seq:
+            continue
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=SSE_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            if await request.is_disconnected():
+                return
+            yield ": keep-alive\n\n"
+
+
+# Server-Sent Events stream of validation progress and per-url state transitions
+@app.get("/api/v1/channels/validate-events")
+async def validate_events(request: Request):
+    """
+    SSE stream. Every VALIDATION_EVENT_INTERVAL seconds (while something changed) it emits a
+    `progress` event (same payload as validate-status) and, if any url changed working/hls state,
+    a `changes` event with the coalesced transitions. Supports resuming via Last-Event-ID.
+    """
+    try:
+        last_seq = int(request.headers.get("last-event-id") or _validation_events["seq"])
+    except ValueError:
+        last_seq = _validation_events["seq"]
+    last_seq = min(last_seq, _validation_events["seq"])
+    return StreamingResponse(
+        _validation_event_stream(request, last_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Endpoint to trigger a playlist crawl
+@app.post("/api/v1/playlists/crawl")
+async def trigger_playlist_crawl():
+    if _playlist_index["running"]:
+        raise HTTPException(status_code=409, detail="crawl already running")
+    asyncio.create_task(crawl_playlists())
+    return {"started": True, "started_at": datetime.utcnow().isoformat()}
+
+
+# Endpoint to inspect playlist crawl status
+@app.get("/api/v1/playlists/crawl-status")
+async def playlist_crawl_status():
+    return {
+        "running": _playlist_index["running"],
+        "started_at": _playlist_index["started_at"],
+        "finished_at": _playlist_index["finished_at"],
+        "total": _playlist_index["total"],
+        "fetched": _playlist_index["fetched"],
+        "not_modified": _playlist_index["not_modified"],
+        "errors": _playlist_index["errors"],
+        "playlists_indexed": len(_playlist_index["playlists"]),
+        "streams_indexed": len(_playlist_index["streams"]),
+    }
+
+# -------------------------
+# Logo proxy: logos cached on disk under data/logos with a size-bounded LRU
+# -------------------------
+_logo_cache: Dict[str, Any] = {
+    "urls": {},               # hash -> origin logo url
+    "entries": None,          # OrderedDict hash -> size in bytes (LRU order, oldest first); loaded lazily
+    "total_bytes": 0,
+    "inflight": {},           # hash -> asyncio.Future shared by concurrent misses
+    "failures": {},           # hash -> datetime of last failed fetch (negative cache)
+    "unknown": set(),         # hashes not found in the channel list last rescanned (negative cache)
+    "scanned_items": None,    # the _channels_cache['items'] list the registry was last rebuilt from
+}
+LOGO_UNKNOWN_MAX = 10_000     # unknown hashes remembered before the set is reset
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+
+def _logo_proxy_path(url: Optional[str]) -> Optional[str]:
+    """Register a logo url with the proxy and return its /api/v1/logos path."""
+    if not url or not url.lower().startswith(("http://", "https://")):
+        return None
+    h = _url_hash(url)
+    _logo_cache["urls"][h] = url
+    return f"/api/v1/logos/{h}"
+
+
+def _logo_url_map(items: List[Dict]) -> Dict[str, str]:
+    """hash -> logo url for every channel logo (runs in the thread pool)."""
+    out = {}
+    for it in items:
+        url = it.get("tvg_logo")
+        if url and url.lower().startswith(("http://", "https://")):
+            out[_url_hash(url)] = url
+    return out
+
+
+async def _lookup_logo_url(h: str) -> Optional[str]:
+    """
+    Origin url for hash h. A hash not registered yet triggers one rescan of the channel
+    list, but only if that list changed since the last rescan; misses are remembered.
+    """
+    url = _logo_cache["urls"].get(h)
+    if url is not None:
+        return url
+    items = _channels_cache["items"]
+    if items is not None and items is not _logo_cache["scanned_items"]:
+        _logo_cache["scanned_items"] = items
+        _logo_cache["unknown"].clear()
+        _logo_cache["urls"].update(await _run_in_thread(_logo_url_map, items))
+        url = _logo_cache["urls"].get(h)
+    if url is None:
+        unknown = _logo_cache["unknown"]
+        if len(unknown) >= LOGO_UNKNOWN_MAX:
+            unknown.clear()
+        unknown.add(h)
+    return url
+
+
+def _logo_paths(h: str) -> Tuple[str, str]:
+    return os.path.join(LOGO_CACHE_DIR, h), os.path.join(LOGO_CACHE_DIR, h + ".type")
+
+
+def _scan_logo_dir() -> "OrderedDict[str, int]":
+    os.makedirs(LOGO_CACHE_DIR, exist_ok=True)
+    found = []
+    for name in os.listdir(LOGO_CACHE_DIR):
+        if name.endswith(".type"):
+            continue
+        try:
+            st = os.stat(os.path.join(LOGO_CACHE_DIR, name))
+        except OSError:
+            continue
+        found.append((st.st_atime, name, st.st_size))
+    found.sort()
+    return OrderedDict((name, size) for _, name, size in found)
+
+
+async def _logo_entries() -> "OrderedDict[str, int]":
+    """LRU bookkeeping, rebuilt from the cache dir (oldest access first) on first use."""
+    if _logo_cache["entries"] is None:
+        entries = await _run_in_thread(_scan_logo_dir)
+        if _logo_cache["entries"] is None:
+            _logo_cache["entries"] = entries
+            _logo_cache["total_bytes"] = sum(entries.values())
+    return _logo_cache["entries"]
+
+
+def _read_logo_files(h: str) -> Tuple[bytes, str]:
+    data_path, type_path = _logo_paths(h)
+    with open(data_path, "rb") as f:
+        data = f.read()
+    with open(type_path, "r", encoding="utf-8") as f:
+        content_type = f.read().strip() or "application/octet-stream"
+    return data, content_type
+
+
+def _write_logo_files(h: str, data: bytes, content_type: str) -> None:
+    data_path, type_path = _logo_paths(h)
+    with open(data_path, "wb") as f:
+        f.write(data)
+    with open(type_path, "w", encoding="utf-8") as f:
+        f.write(content_type)
+
+
+def _remove_logo_files(hashes: List[str]) -> None:
+    for h in hashes:
+        for path in _logo_paths(h):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+async def _read_cached_logo(h: str) -> Optional[Tuple[bytes, str]]:
+    entries = await _logo_entries()
+    if h not in entries:
+        return None
+    try:
+        data, content_type = await _run_in_thread(_read_logo_files, h)
+    except OSError:
+        _logo_cache["total_bytes"] -= entries.pop(h, 0)
+        return None
+    if h in entries:
+        entries.move_to_end(h)
+    return data, content_type
+
+
+async def _store_cached_logo(h: str, data: bytes, content_type: str) -> None:
+    entries = await _logo_entries()
+    try:
+        await _run_in_thread(_write_logo_files, h, data, content_type)
+    except OSError:
+        return
+    _logo_cache["total_bytes"] += len(data) - entries.pop(h, 0)
+    entries[h] = len(data)
+    # evict least recently used until we are back under budget
+    evicted = []
+    while _logo_cache["total_bytes"] > LOGO_CACHE_MAX_BYTES and len(entries) > 1:
+        old, size = entries.popitem(last=False)
+        _logo_cache["total_bytes"] -= size
+        evicted.append(old)
+    if evicted:
+        await _run_in_thread(_remove_logo_files, evicted)
+
+
+async def _fetch_logo(url: str) -> Tuple[bytes, str]:
+    async with httpx.AsyncClient(timeout=LOGO_FETCH_TIMEOUT, follow_redirects=True) as client:
+        async with client.stream("GET", url) as r:
+            r.raise_for_status()
+            content_type = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/"):
+                raise ValueError(f"not an image ({content_type or 'no content-type'})")
+            chunks = []
+            size = 0
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+                if size > LOGO_MAX_BYTES:
+                    raise ValueError("logo too large")
+                chunks.append(chunk)
+    return b"".join(chunks), content_type
+
+
+async def _get_logo(h: str) -> Optional[Tuple[bytes, str]]:
+    """
+    Cached logo bytes for hash h. Concurrent misses share one upstream fetch;
+    failures are remembered for LOGO_NEGATIVE_TTL. Returns None if unavailable.
+    """
+    cached = await _read_cached_logo(h)
+    if cached:
+        return cached
+
+    failed_at = _logo_cache["failures"].get(h)
+    if failed_at and datetime.utcnow() - failed_at < LOGO_NEGATIVE_TTL:
+        return None
+
+    url = await _lookup_logo_url(h)
+    if url is None:
+        return None
+
+    inflight = _logo_cache["inflight"].get(h)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    fut = asyncio.get_running_loop().create_future()
+    _logo_cache["inflight"][h] = fut
+    result = None
+    try:
+        data, content_type = await _fetch_logo(url)
+        await _store_cached_logo(h, data, content_type)
+        _logo_cache["failures"].pop(h, None)
+        result = (data, content_type)
+    except Exception:
+        _logo_cache["failures"][h] = datetime.utcnow()
+    finally:
+        del _logo_cache["inflight"][h]
+        fut.set_result(result)
+    return result
+
+
+# -------------------------
+# HLS relay: rewritten playlists + shared segment cache so many viewers cost one upstream fetch
+# -------------------------
+_relay: Dict[str, Any] = {
+    "urls": OrderedDict(),    # token -> upstream url (LRU, RELAY_MAX_URLS)
+    "playlists": {},          # upstream url -> (monotonic fetched_at, rewritten text)
+    "playlist_inflight": {},  # upstream url -> asyncio.Future
+    "segments": OrderedDict(),  # upstream url -> (bytes, content_type) (LRU, RELAY_SEGMENT_CACHE_BYTES)
+    "segment_bytes": 0,
+    "segment_inflight": {},   # upstream url -> download state shared by concurrent viewers
+    "client": None,           # shared httpx client (keeps upstream connections alive)
+    "transport": None,        # optional httpx transport for the client (e.g. a fake HLS origin in tests)
+    "host_checks": {},        # host -> (monotonic checked_at, is_public)
+    "unknown": set(),         # tokens not found in the channel list last rescanned
+    "scanned": None,          # (items list, validated_map size) the registry was last rebuilt from
+}
+
+URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+
+
+def _is_public_ip(addr: str) -> bool:
+    try:
+        return ipaddress.ip_address(addr).is_global
+    except ValueError:
+        return False
+
+
+def _is_literal_private_host(host: Optional[str]) -> bool:
+    """Loopback names and non-global IP literals; hostnames are checked after DNS in _relay_guard."""
+    host = (host or "").lower()
+    if not host or host == "localhost" or host.endswith(".localhost"):
+        return True
+    try:
+        return not ipaddress.ip_address(host).is_global
+    except ValueError:
+        return False
+
+
+async def _resolve_host(host: str) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+async def _is_public_host(host: str) -> bool:
+    if RELAY_ALLOW_PRIVATE_HOSTS:
+        return True
+    cached = _relay["host_checks"].get(host)
+    if cached and time.monotonic() - cached[0] < RELAY_HOST_CHECK_TTL:
+        return cached[1]
+    if _is_literal_private_host(host):
+        ok = False
+    else:
+        try:
+            ipaddress.ip_address(host)
+            ok = True
+        except ValueError:
+            try:
+                addrs = await _resolve_host(host)
+                ok = bool(addrs) and all(_is_public_ip(a) for a in addrs)
+            except OSError:
+                ok = False
+    _relay["host_checks"][host] = (time.monotonic(), ok)
+    return ok
+
+
+async def _relay_guard(request: httpx.Request) -> None:
+    """httpx request hook: every relay request, including redirects, must go to a public host."""
+    if not await _is_public_host(request.url.host):
+        raise ValueError(f"refusing to relay non-public host {request.url.host}")
+
+
+def _relay_client() -> httpx.AsyncClient:
+    if _relay["client"] is None:
+        _relay["client"] = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            transport=_relay["transport"],
+            event_hooks={"request": [_relay_guard]},
+        )
+    return _relay["client"]
+
+
+def _relay_register(url: str) -> str:
+    token = _url_hash(url)
+    urls = _relay["urls"]
+    urls[token] = url
+    urls.move_to_end(token)
+    while len(urls) > RELAY_MAX_URLS:
+        urls.popitem(last=False)
+    return token
+
+
+def _relay_entry_path(url: Optional[str], vald: Optional[Dict]) -> Optional[str]:
+    """Relay playlist path for a channel, if relaying is on and validation marked it HLS compatible."""
+    if not HLS_RELAY_ENABLED or not url or not vald or not vald.get("hls_compatible"):
+        return None
+    return f"/api/v1/relay/p/{_relay_register(url)}.m3u8"
+
+
+def _relay_eligible_map(items: List[Dict], validated: Dict[str, Dict]) -> Dict[str, str]:
+    """token -> url for every channel validated as HLS compatible (runs in the thread pool)."""
+    out = {}
+    for it in items:
+        url = it.get("url")
+        vald = validated.get(url) if url else None
+        if vald and vald.get("hls_compatible"):
+            out[_url_hash(url)] = url
+    return out
+
+
+async def _relay_lookup(token: str) -> Optional[str]:
+    """
+    Upstream url for a relay token. An unregistered token triggers one rescan of eligible
+    channels, only when the channel list or validation results changed since the last one.
+    """
+    url = _relay["urls"].get(token)
+    if url is not None:
+        return url
+    items = _channels_cache["items"]
+    validated = _channels_cache["validated_map"]
+    scanned = _relay["scanned"]
+    if items is not None and (scanned is None or scanned[0] is not items or scanned[1] != len(validated)):
+        _relay["scanned"] = (items, len(validated))
+        _relay["unknown"].clear()
+        for tok, u in (await _run_in_thread(_relay_eligible_map, items, validated)).items():
+            if tok not in _relay["urls"]:
+                _relay_register(u)
+        url = _relay["urls"].get(token)
+    if url is None:
+        if len(_relay["unknown"]) >= RELAY_MAX_URLS:
+            _relay["unknown"].clear()
+        _relay["unknown"].add(token)
+    return url
+
+
+def _rewrite_hls_playlist(text: str, base_url: str) -> str:
+    """
+    Point every URI in a master or media playlist back at the relay. Variant / rendition
+    playlists go to /relay/p, everything else (segments, keys, init maps) to /relay/s.
+    """
+    def _target(ref: str, is_playlist: bool) -> str:
+        absolute = urljoin(base_url, ref)
+        if not absolute.lower().startswith(("http://", "https://")):
+            return ref
+        if not RELAY_ALLOW_PRIVATE_HOSTS and _is_literal_private_host(urlparse(absolute).hostname):
+            # never proxy loopback/private addresses a third-party playlist points at
+            return ref
+        if not is_playlist:
+            is_playlist = urlparse(absolute).path.lower().endswith((".m3u8", ".m3u"))
+        token = _relay_register(absolute)
+        return f"/api/v1/relay/p/{token}.m3u8" if is_playlist else f"/api/v1/relay/s/{token}"
+
+    out = []
+    next_is_playlist = False
+    for line in text.splitlines():
+        ln = line.strip()
+        if not ln:
+            continue
+        if ln.startswith("#"):
+            if ln.startswith("#EXT-X-STREAM-INF"):
+                next_is_playlist = True
+            if 'URI="' in ln:
+                tag_is_playlist = ln.startswith(("#EXT-X-MEDIA:", "#EXT-X-I-FRAME-STREAM-INF"))
+                ln = URI_ATTR_RE.sub(lambda m: f'URI="{_target(m.group(1), tag_is_playlist)}"', ln)
+            out.append(ln)
+            continue
+        out.append(_target(ln, next_is_playlist))
+        next_is_playlist = False
+    return "\n".join(out) + "\n"
+
+
+async def _relay_playlist(url: str) -> str:
+    """
+    Rewritten playlist for url, shared by all viewers for RELAY_PLAYLIST_TTL seconds.
+    Concurrent misses share one upstream fetch. Raises ValueError if the response is not HLS.
+    """
+    cached = _relay["playlists"].get(url)
+    if cached and time.monotonic() - cached[0] < RELAY_PLAYLIST_TTL:
+        return cached[1]
+
+    inflight = _relay["playlist_inflight"].get(url)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    fut = asyncio.get_running_loop().create_future()
+    _relay["playlist_inflight"][url] = fut
+    try:
+        async with _relay_client().stream("GET", url) as r:
+            r.raise_for_status()
+            chunks = []
+            size = 0
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+                if size > RELAY_PLAYLIST_MAX_BYTES:
+                    raise ValueError("playlist too large")
+                chunks.append(chunk)
+            headers, final_url = r.headers, str(r.url)
+        body = b"".join(chunks)
+        # same eligibility rule the validator uses
+        is_hls, reason = _detect_hls_from_headers_and_sample(headers, body[:4096])
+        if not is_hls:
+            raise ValueError(reason or "not an HLS playlist")
+        text = _rewrite_hls_playlist(body.decode("utf-8", errors="ignore"), final_url)
+        now = time.monotonic()
+        playlists = _relay["playlists"]
+        playlists[url] = (now, text)
+        if len(playlists) > RELAY_MAX_URLS // 10:
+            for u in [u for u, (t, _) in playlists.items() if now - t >= RELAY_PLAYLIST_TTL]:
+                del playlists[u]
+        fut.set_result(text)
+        return text
+    except Exception as e:
+        fut.set_exception(e)
+        # mark retrieved so an unawaited future does not log
+        fut.exception()
+        raise
+    finally:
+        del _relay["playlist_inflight"][url]
+
+
+def _relay_cache_segment(url: str, data: bytes, content_type: str) -> None:
+    segments = _relay["segments"]
+    if url in segments:
+        return
+    segments[url] = (data, content_type)
+    _relay["segment_bytes"] += len(data)
+    while _relay["segment_bytes"] > RELAY_SEGMENT_CACHE_BYTES and segments:
+        _, (old, _) = segments.popitem(last=False)
+        _relay["segment_bytes"] -= len(old)
+
+
+async def _relay_download(url: str, dl: Dict[str, Any]) -> None:
+    """Download a segment once, publishing chunks to every viewer attached to dl as they arrive."""
+    cond = dl["cond"]
+    size = 0
+    try:
+        async with _relay_client().stream("GET", url) as r:
+            r.raise_for_status()
+            async with cond:
+                dl["content_type"] = r.headers.get("content-type") or "application/octet-stream"
+                cond.notify_all()
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+                if size > RELAY_SEGMENT_MAX_BYTES:
+                    raise ValueError("segment too large")
+                async with cond:
+                    dl["chunks"].append(chunk)
+                    cond.notify_all()
+    except Exception as e:
+        dl["error"] = str(e) or e.__class__.__name__
+    finally:
+        async with cond:
+            dl["done"] = True
+            cond.notify_all()
+        del _relay["segment_inflight"][url]
+        if dl["error"] is None:
+            _relay_cache_segment(url, b"".join(dl["chunks"]), dl["content_type"])
+
+
+def _relay_segment_download(url: str) -> Dict[str, Any]:
+    dl = _relay["segment_inflight"].get(url)
+    if dl is None:
+        dl = {"chunks": [], "content_type": None, "done": False, "error": None, "cond": asyncio.Condition()}
+        _relay["segment_inflight"][url] = dl
+        asyncio.create_task(_relay_download(url, dl))
+    return dl
+
+
+async def _relay_stream(dl: Dict[str, Any]) -> AsyncIterator[bytes]:
+    cond = dl["cond"]
+    i = 0
+    while True:
+        async with cond:
+            await cond.wait_for(lambda: i < len(dl["chunks"]) or dl["done"])
+            new = dl["chunks"][i:]
+            done = dl["done"]
+        for chunk in new:
+            yield chunk
+        i += len(new)
+        if done and i >= len(dl["chunks"]):
+            return
+
+
+# -------------------------
+# EPG: XMLTV guides streamed into a compact per-channel, time-sorted index
+# -------------------------
+_epg: Dict[str, Any] = {
+    "sources": {},            # source -> {etag, last_modified, mtime, file, channels, programmes, loaded_at, error}
+    "parsed": {},             # source -> {channel id: (starts, stops, titles, descs)} from that source
+    "index": {},              # channel id (lowercase) -> (starts, stops, titles, descs) across all sources
+    "running": False,
+    "last_refresh": None,
+    "lock": asyncio.Lock(),
+    "task": None,
+}
+
+XMLTV_TIME_RE = re.compile(r"^(\d{14})(?:\s*([+-])(\d{2})(\d{2}))?")
+
+
+def _parse_xmltv_time(value: Optional[str]) -> Optional[int]:
+    """XMLTV timestamp ("20240101120000 +0100") -> epoch seconds."""
+    m = XMLTV_TIME_RE.match((value or "").strip())
+    if not m:
+        return None
+    try:
+        ts = calendar.timegm(time.strptime(m.group(1), "%Y%m%d%H%M%S"))
+    except ValueError:
+        return None
+    if m.group(2):
+        offset = int(m.group(3)) * 3600 + int(m.group(4)) * 60
+        ts -= offset if m.group(2) == "+" else -offset
+    return ts
+
+
+def _compact_programmes(rows: List[Tuple[int, int, Optional[str], Optional[str]]]) -> Tuple[array, array, List, List]:
+    """Sort rows by start and pack them into parallel arrays; a missing stop becomes the next start."""
+    rows.sort(key=lambda r: r[0])
+    starts, stops, titles, descs = array("q"), array("q"), [], []
+    for i, (start, stop, title, desc) in enumerate(rows):
+        if stop <= start and i + 1 < len(rows):
+            stop = rows[i + 1][0]
+        starts.append(start)
+        stops.append(stop)
+        titles.append(title)
+        descs.append(desc)
+    return starts, stops, titles, descs
+
+
+def parse_xmltv_file(path: str, window_start: int, window_end: int) -> Dict[str, Tuple[array, array, List, List]]:
+    """
+    Incrementally parse an XMLTV file (plain or gzip) keeping only programmes that overlap
+    [window_start, window_end]. Elements are cleared as soon as they are read, so memory is
+    bounded by the size of the result rather than the file.
+    """
+    with open(path, "rb") as raw:
+        gzipped = raw.read(2) == b"\x1f\x8b"
+    rows: Dict[str, List] = {}
+    with (gzip.open(path, "rb") if gzipped else open(path, "rb")) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end":
+                continue
+            if elem.tag == "programme":
+                channel = (elem.get("channel") or "").strip().lower()
+                start = _parse_xmltv_time(elem.get("start"))
+                if channel and start is not None:
+                    stop = _parse_xmltv_time(elem.get("stop"))
+                    stop = stop if stop is not None else start
+                    if stop >= window_start and start <= window_end:
+                        desc = elem.findtext("desc")
+                        rows.setdefault(channel, []).append((
+                            start,
+                            stop,
+                            elem.findtext("title"),
+                            desc[:EPG_DESC_MAX_CHARS] if desc else None,
+                        ))
+                root.clear()
+            elif elem.tag == "channel":
+                root.clear()
+    return {channel: _compact_programmes(r) for channel, r in rows.items()}
+
+
+async def _download_epg_source(url: str, meta: Dict[str, Any]) -> bool:
+    """
+    Stream an XMLTV url to EPG_CACHE_DIR with a conditional request.
+    Returns True if new content was written, False on 304.
+    """
+    os.makedirs(EPG_CACHE_DIR, exist_ok=True)
+    dest = os.path.join(EPG_CACHE_DIR, _url_hash(url) + ".xmltv")
+    headers = {}
+    if os.path.exists(dest):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT, follow_redirects=True) as client:
+        async with client.stream("GET", url, headers=headers) as r:
+            if r.status_code == 304:
+                return False
+            r.raise_for_status()
+            tmp = dest + ".part"
+            with open(tmp, "wb") as f:
+                async for chunk in r.aiter_bytes():
+                    f.write(chunk)
+            os.replace(tmp, dest)
+            meta["etag"] = r.headers.get("etag")
+            meta["last_modified"] = r.headers.get("last-modified")
+    meta["file"] = dest
+    return True
+
+
+def _prune_programmes(entry: Tuple[array, array, List, List], cutoff: int) -> Tuple[array, array, List, List]:
+    starts, stops, titles, descs = entry
+    i = 0
+    while i < len(stops) and stops[i] < cutoff:
+        i += 1
+    if i == 0:
+        return entry
+    return starts[i:], stops[i:], titles[i:], descs[i:]
+
+
+def _rebuild_epg_index() -> None:
+    """Merge per-source results into the lookup index, dropping programmes older than EPG_KEEP_PAST."""
+    cutoff = int(time.time() - EPG_KEEP_PAST.total_seconds())
+    merged: Dict[str, List] = {}
+    for source in EPG_SOURCES:
+        for channel, entry in (_epg["parsed"].get(source) or {}).items():
+            merged.setdefault(channel, []).append(entry)
+    index = {}
+    for channel, entries in merged.items():
+        if len(entries) == 1:
+            entry = entries[0]
+        else:
+            # same start in several sources: the first source listed wins
+            rows = {row[0]: row for e in reversed(entries) for row in zip(*e)}
+            entry = _compact_programmes(list(rows.values()))
+        entry = _prune_programmes(entry, cutoff)
+        if len(entry[0]):
+            index[channel] = entry
+    _epg["index"] = index
+
+
+async def refresh_epg(force: bool = False) -> None:
+    """
+    Re-read EPG_SOURCES. Urls use conditional requests and local files their mtime, so
+    unchanged sources are not parsed again; the index is still rebuilt to drop old programmes.
+    """
+    async with _epg["lock"]:
+        if _epg["running"]:
+            return
+        _epg["running"] = True
+    try:
+        now = time.time()
+        window = (int(now - EPG_KEEP_PAST.total_seconds()), int(now + EPG_KEEP_FUTURE.total_seconds()))
+        for source in EPG_SOURCES:
+            meta = _epg["sources"].setdefault(source, {})
+            try:
+                if source.lower().startswith(("http://", "https://")):
+                    changed = await _download_epg_source(source, meta)
+                else:
+                    mtime = os.path.getmtime(source)
+                    changed = mtime != meta.get("mtime")
+                    meta["mtime"] = mtime
+                    meta["file"] = source
+                if changed or force or source not in _epg["parsed"]:
+                    parsed = await _run_cpu(parse_xmltv_file, meta["file"], *window)
+                    _epg["parsed"][source] = parsed
+                    meta["channels"] = len(parsed)
+                    meta["programmes"] = sum(len(e[0]) for e in parsed.values())
+                    meta["loaded_at"] = datetime.utcnow().isoformat()
+                meta["error"] = None
+            except Exception as e:
+                meta["error"] = str(e) or e.__class__.__name__
+        for source in list(_epg["parsed"]):
+            if source not in EPG_SOURCES:
+                del _epg["parsed"][source]
+        _rebuild_epg_index()
+        _epg["last_refresh"] = datetime.utcnow().isoformat()
+    finally:
+        _epg["running"] = False
+
+
+async def _epg_refresh_loop() -> None:
+    while True:
+        try:
+            await refresh_epg()
+        except Exception:
+            logger.exception("EPG refresh failed")
+        await asyncio.sleep(EPG_REFRESH_INTERVAL.total_seconds())
+
+
+def _programme(entry: Tuple[array, array, List, List], i: int) -> Programme:
+    starts, stops, titles, descs = entry
+    return Programme(
+        start=datetime.utcfromtimestamp(starts[i]).isoformat(),
+        stop=datetime.utcfromtimestamp(stops[i]).isoformat(),
+        title=titles[i],
+        description=descs[i],
+    )
+
+
+def _epg_now_next(tvg_id: Optional[str], ts: int) -> Tuple[Optional[Programme], Optional[Programme]]:
+    entry = _epg["index"].get((tvg_id or "").strip().lower())
+    if entry is None:
+        return None, None
+    starts, stops = entry[0], entry[1]
+    i = bisect_right(starts, ts) - 1
+    now = _programme(entry, i) if i >= 0 and stops[i] > ts else None
+    nxt = _programme(entry, i + 1) if i + 1 < len(starts) else None
+    return now, nxt
+
+
+def _epg_between(tvg_id: str, start_ts: int, end_ts: int) -> List[Programme]:
+    entry = _epg["index"].get(tvg_id.strip().lower())
+    if entry is None:
+        return []
+    starts, stops = entry[0], entry[1]
+    # the programme running at start_ts starts at or before it
+    i = max(0, bisect_right(starts, start_ts) - 1)
+    out = []
+    while i < len(starts) and starts[i] < end_ts:
+        if stops[i] > start_ts:
+            out.append(_programme(entry, i))
+        i += 1
+    return out
+
+
+def _epoch(dt: datetime) -> int:
+    # naive datetimes are taken as UTC, like the rest of the API
+    return calendar.timegm(dt.utctimetuple())
+
+
 @app.on_event("startup")
 async def startup_event():
     # Preload languages & countries from disk (non-blocking minimal)
@@ -630,10 +2025,30 @@ async def startup_event():
     try:
         await _read_or_fetch_languages()
         await _read_or_fetch_countries()
+        _load_playlist_index_file()
         # preload channel list (parsing) but do not validate all channels at startup
         await _load_channels()
     except Exception:
         pass
+    # crawl country/language playlists in background (conditional requests keep this cheap)
+    _schedule_playlist_crawl_if_stale()
+    if _loop_lag["task"] is None:
+        _loop_lag["task"] = asyncio.create_task(_monitor_loop_lag())
+    if EPG_SOURCES and _epg["task"] is None:
+        _epg["task"] = asyncio.create_task(_epg_refresh_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for state in (_relay, _probe_coordinator):
+        if state["client"] is not None:
+            await state["client"].aclose()
+            state["client"] = None
+    for state in (_loop_lag, _epg):
+        if state["task"] is not None:
+            state["task"].cancel()
+            state["task"] = None
+    _shutdown_executors()
 
 
 # --- Languages endpoints ---
@@ -707,28 +2122,86 @@ async def get_city(city_code: str):
 
 
 # --- Channels endpoints ---
-@app.get("/api/v1/channels", response_model=List[Channel])
-async def list_channels(
-    page: int = Query(1, ge=1),
-    limit: int = Query(50, ge=1, le=500),
-    q: Optional[str] = None,
-    refresh: bool = False,
-    validate: bool = Query(False, description="If true, validate channel URLs before returning"),
-    working_only: bool = Query(True, description="If true, only return channels that are marked working (after validation)."),
-):
+def _to_channel(it: Dict) -> Channel:
+    """Build a Channel model from a parsed channel dict plus cached validation info (if any)."""
+    url = it.get("url")
+    vald = _channels_cache["validated_map"].get(url) if url else None
+    return Channel(
+        id=it.get("id"),
+        name=it.get("name"),
+        tvg_id=it.get("tvg_id"),
+        tvg_name=it.get("tvg_name"),
+        tvg_logo=it.get("tvg_logo"),
+        logo_url=_logo_proxy_path(it.get("tvg_logo")),
+        relay_url=_relay_entry_path(url, vald),
+        group=it.get("group"),
+        language=it.get("language"),
+        country=it.get("country"),
+        url=url,
+        countries=it.get("countries"),
+        subdivisions=it.get("subdivisions"),
+        cities=it.get("cities"),
+        languages=it.get("languages"),
+        working=vald.get("working") if vald else None,
+        hls_compatible=vald.get("hls_compatible") if vald else None,
+        last_checked=vald.get("last_checked") if vald else None,
+        check_error=vald.get("check_error") if vald else None,
+        latency_ms=vald.get("latency_ms") if vald else None,
+    )
+
+
+def _to_channel_group(it: Dict) -> Channel:
+    """Channel for the mirror group of it: the best-ranked mirror, plus all mirrors in rank order."""
+    ranked = _rank_mirrors(_mirrors_of(it))
+    ch = _to_channel(ranked[0])
+    validated = _channels_cache["validated_map"]
+    ch.mirrors = []
+    for m in ranked:
+        vald = validated.get(m["url"]) or {}
+        ch.mirrors.append(ChannelMirror(
+            url=m["url"],
+            working=vald.get("working"),
+            hls_compatible=vald.get("hls_compatible"),
+            latency_ms=vald.get("latency_ms"),
+            last_checked=vald.get("last_checked"),
+        ))
+    return ch
+
+
+def _count_items(items: Iterable[Dict]) -> int:
+    return sum(1 for _ in items)
+
+
+def _matches_text(it: Dict, ql: str) -> bool:
+    return bool(
+        (it.get("name") and ql in it.get("name", "").lower())
+        or (it.get("group") and ql in it.get("group", "").lower())
+        or (it.get("country") and ql in (it.get("country") or "").lower())
+        or (it.get("language") and ql in (it.get("language") or "").lower())
+    )
+
+
+async def _select_channels(q: Optional[str], refresh: bool = False) -> Iterable[Dict]:
     """
-    Paginated list of channels parsed from the remote index.
-    - page, limit: pagination
-    - q: search text against name/group/country/language
-    - refresh=true: force re-fetch/parse of index.m3u
-    - validate=true: actively validate URLs (may be slow)
-    - working_only=true: after validation filter out non-working
+    Channels matching q, in index order. Text searches are returned as a lazy
+    iterator over the cached list so large consumers (exports) never copy it.
     """
-    # If q matches a known language/country/subdivision/city, fetch that specific playlist
+    # If q matches a known language/country/subdivision/city, serve it from the crawled
+    # playlist index, or fetch that specific playlist if it has not been crawled yet
+    _schedule_playlist_crawl_if_stale()
     special = await _resolve_playlist_for_query(q) if q else None
+    local_items = None
     if special and special.get("url"):
+        try:
+            await _load_channels()
+        except Exception:
+            pass
+        local_items = _local_playlist_items(special)
+    if local_items is not None:
+        items = local_items
+    elif special and special.get("url"):
         text = await _fetch_text(special["url"])
-        items = parse_m3u_index(text)
+        items = await _run_cpu(parse_m3u_index, text)
 
         # Annotate parsed items with known code to make filtering/UX consistent
         t = special.get("type")
@@ -749,110 +2222,106 @@ async def list_channels(
         # apply search filter first (nice to narrow validation scope)
         if q:
             ql = q.lower()
-            items = [
-                it for it in items
-                if (it.get("name") and ql in it.get("name", "").lower())
-                or (it.get("group") and ql in it.get("group", "").lower())
-                or (it.get("country") and ql in (it.get("country") or "").lower())
-                or (it.get("language") and ql in (it.get("language") or "").lower())
-            ]
+            items = (it for it in items if _matches_text(it, ql))
+
+    return items
+
+
+@app.get("/api/v1/channels", response_model=List[Channel])
+async def list_channels(
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    q: Optional[str] = None,
+    refresh: bool = False,
+    validate: bool = Query(False, description="If true, validate channel URLs before returning"),
+    working_only: bool = Query(True, description="If true, only return channels that are marked working (after validation)."),
+    group_mirrors: bool = Query(False, description="If true, collapse entries sharing a tvg-id (or name) into one channel with ranked mirrors."),
+    include_epg: bool = Query(False, description="If true, attach the current programme (now_playing) from the EPG."),
+):
+    """
+    Paginated list of channels parsed from the remote index.
+    - page, limit: pagination
+    - q: search text against name/group/country/language
+    - refresh=true: force re-fetch/parse of index.m3u
+    - validate=true: actively validate URLs (may be slow)
+    - working_only=true: after validation filter out non-working
+    - group_mirrors=true: one item per channel; `url` is the best mirror, `mirrors` lists all of them
+    - include_epg=true: attach `now_playing` from the EPG index
+    """
+    items = await _select_channels(q, refresh=refresh)
+    if group_mirrors:
+        items = _collapse_mirrors(items)
 
     # pagination
-    total = len(items)
     start = (page - 1) * limit
     end = start + limit
-    page_items = items[start:end]
+    page_items = list(islice(items, start, end))
+    # with group_mirrors every page item stands for its whole mirror group
+    targets = [m for it in page_items for m in _mirrors_of(it)] if group_mirrors else page_items
 
-    # if validate flag set, run validation for page_items; otherwise rely on validated_map if available
+    # if validate flag set, run validation for page_items; otherwise rely on validated_map if available.
+    # If working_only requested, filter by working==True. If no validation was done and working flags are None,
+    # then being strict would return empty — therefore if working_only we force validation for items missing validated info.
+    # Either way it is a single call, so the request waits at most one PROBE_REQUEST_DEADLINE.
     if validate:
-        await validate_channels_for_list(page_items)
+        to_validate = targets
+    elif working_only:
+        to_validate = [it for it in targets if it.get("url") and _channels_cache["validated_map"].get(it["url"]) is None]
+    else:
+        to_validate = []
+    if to_validate:
+        await validate_channels_for_list(to_validate)
 
     # assemble Channel models and attach validation info from cache (if any)
-    out: List[Channel] = []
-    for it in page_items:
-        url = it.get("url")
-        vald = _channels_cache["validated_map"].get(url) if url else None
-        ch = Channel(
-            id=it.get("id"),
-            name=it.get("name"),
-            tvg_id=it.get("tvg_id"),
-            tvg_name=it.get("tvg_name"),
-            tvg_logo=it.get("tvg_logo"),
-            group=it.get("group"),
-            language=it.get("language"),
-            country=it.get("country"),
-            url=url,
-            working=vald.get("working") if vald else None,
-            hls_compatible=vald.get("hls_compatible") if vald else None,
-            last_checked=vald.get("last_checked") if vald else None,
-            check_error=vald.get("check_error") if vald else None,
-        )
-        out.append(ch)
+    to_channel = _to_channel_group if group_mirrors else _to_channel
+    out: List[Channel] = [to_channel(it) for it in page_items]
 
-    # If working_only requested, filter by working==True. If no validation was done and working flags are None,
-    # then being strict would return empty — therefore if working_only we force validation for items missing validated info.
     if working_only:
-        # find items missing validation in the current out set
-        missing_validation_urls = [c.url for c in out if c.url and _channels_cache["validated_map"].get(c.url) is None]
-        if missing_validation_urls:
-            # validate those
-            to_validate = [it for it in page_items if it.get("url") in missing_validation_urls]
-            await validate_channels_for_list(to_validate)
-            # rebuild out
-            new_out = []
-            for it in page_items:
-                url = it.get("url")
-                vald = _channels_cache["validated_map"].get(url) if url else None
-                ch = Channel(
-                    id=it.get("id"),
-                    name=it.get("name"),
-                    tvg_id=it.get("tvg_id"),
-                    tvg_name=it.get("tvg_name"),
-                    tvg_logo=it.get("tvg_logo"),
-                    group=it.get("group"),
-                    language=it.get("language"),
-                    country=it.get("country"),
-                    url=url,
-                    working=vald.get("working") if vald else None,
-                    hls_compatible=vald.get("hls_compatible") if vald else None,
-                    last_checked=vald.get("last_checked") if vald else None,
-                    check_error=vald.get("check_error") if vald else None,
-                )
-                new_out.append(ch)
-            out = new_out
-        # now filter
         out = [c for c in out if c.working]
 
+    if include_epg:
+        now = int(time.time())
+        for c in out:
+            c.now_playing = _epg_now_next(c.tvg_id, now)[0]
+
     return out
 
+
+@app.get("/api/v1/channels/{channel_id}/best", response_model=Channel)
+async def best_mirror(channel_id: str):
+    """
+    Currently best working mirror for a channel (tvg-id, or channel name), read from the
+    mirror index maintained as validation results come in.
+    """
+    await _load_channels()
+    key = channel_id.strip().lower()
+    if key not in _channels_cache["mirror_best"]:
+        key = _mirror_key({"name": channel_id}) or ""
+    url = _channels_cache["mirror_best"].get(key)
+    it = _channels_cache["by_url"].get(url) if url else None
+    if it is None:
+        raise HTTPException(status_code=404, detail="channel not found")
+    vald = _channels_cache["validated_map"].get(url)
+    if not vald or not vald.get("working"):
+        raise HTTPException(status_code=404, detail="no working mirror known (validate first)")
+    return _to_channel_group(it)
+
+
 @app.get("/api/v1/channels/count")
 async def channels_count(q: Optional[str] = None):
-    # If q resolves to a specific playlist, count from that playlist directly
-    special = await _resolve_playlist_for_query(q) if q else None
-    if special and special.get("url"):
-        text = await _fetch_text(special["url"])
-        items = parse_m3u_index(text)
-        return {"total": len(items)}
-
-    # Otherwise count from full index with text search
-    items = await _load_channels()
-    if q:
-        ql = q.lower()
-        items = [
-            it for it in items
-            if (it.get("name") and ql in it.get("name", "").lower())
-            or (it.get("group") and ql in it.get("group", "").lower())
-            or (it.get("country") and ql in (it.get("country") or "").lower())
-            or (it.get("language") and ql in (it.get("language") or "").lower())
-        ]
-    total = len(items)
+    # resolved playlists are served from the crawled index (or fetched directly);
+    # otherwise count from full index with text search
+    items = await _select_channels(q)
+    # a text search scans the whole list: do it in the thread pool
+    total = await _run_in_thread(_count_items, items)
     return {"total": total}
 
 
 @app.get("/api/v1/channels/summary")
 async def channels_summary():
     """
-    Quick summary: total channels parsed, validated count, working count, last_loaded.
+    Quick summary: total channels parsed, validated count, working count, last_loaded,
+    and request-path probe coordinator counters.
     """
     items = await _load_channels()
     parsed_count = len(items)
@@ -864,8 +2333,29 @@ async def channels_summary():
         "validated_count": validated_count,
         "working_count": working_count,
         "last_loaded": _channels_cache["last_loaded"].isoformat() if _channels_cache["last_loaded"] else None,
+        "probes": {
+            "inflight": len(_probe_coordinator["inflight"]),
+            "admitted": _probe_coordinator["admitted"],
+            "joined": _probe_coordinator["joined"],
+            "shed": _probe_coordinator["shed"],
+            "deadline_exceeded": _probe_coordinator["deadline_exceeded"],
+        },
+    }
+
+@app.get("/api/v1/debug/loop")
+async def debug_loop():
+    """Event-loop lag monitor counters (stall = sample lagging more than LOOP_LAG_THRESHOLD)."""
+    return {
+        "executor": CPU_EXECUTOR_KIND,
+        "workers": CPU_EXECUTOR_WORKERS,
+        "samples": _loop_lag["samples"],
+        "stalls": _loop_lag["stalls"],
+        "max_lag_ms": _loop_lag["max_lag_ms"],
+        "last_stall_at": _loop_lag["last_stall_at"],
+        "threshold_ms": LOOP_LAG_THRESHOLD * 1000.0,
     }
 
+
 @app.get("/api/v1/debug/sample")
 async def debug_sample(n: int = Query(5, ge=1, le=100)):
     """
@@ -895,3 +2385,208 @@ async def debug_sample(n: int = Query(5, ge=1, le=100)):
         "nonnull_country": nonnull_country,
         "sample": sample,
     }
+
+
+# --- Export endpoints ---
+def _passes_validation_filter(it: Dict, working_only: bool, hls_only: bool) -> bool:
+    if not (working_only or hls_only):
+        return True
+    url = it.get("url")
+    vald = _channels_cache["validated_map"].get(url) if url else None
+    if not vald:
+        return False
+    if working_only and not vald.get("working"):
+        return False
+    if hls_only and not vald.get("hls_compatible"):
+        return False
+    return True
+
+
+def _extinf_line(it: Dict) -> str:
+    attrs = it.get("extinf_attrs")
+    if attrs is None:
+        # entries parsed before extinf_attrs existed: rebuild the common tvg attributes
+        pairs = [
+            ("tvg-id", it.get("tvg_id")),
+            ("tvg-name", it.get("tvg_name")),
+            ("tvg-logo", it.get("tvg_logo")),
+            ("group-title", it.get("group")),
+        ]
+        attrs = " ".join(f'{k}="{v}"' for k, v in pairs if v)
+    name = it.get("name") or ""
+    return f"#EXTINF:-1 {attrs},{name}" if attrs else f"#EXTINF:-1,{name}"
+
+
+async def _stream_lines(items: Iterable[Dict], render, header: Optional[str], working_only: bool, hls_only: bool) -> AsyncIterator[str]:
+    """
+    Render matching items lazily, yielding EXPORT_CHUNK_LINES lines per chunk so memory
+    stays constant regardless of export size.
+    """
+    buf: List[str] = [header] if header else []
+    for it in items:
+        if not it.get("url") or not _passes_validation_filter(it, working_only, hls_only):
+            continue
+        buf.append(render(it))
+        if len(buf) >= EXPORT_CHUNK_LINES:
+            yield "\n".join(buf) + "\n"
+            buf = []
+            # let other requests run between chunks
+            await asyncio.sleep(0)
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+@app.get("/api/v1/export.m3u")
+async def export_m3u(
+    q: Optional[str] = None,
+    working_only: bool = Query(True, description="Only channels marked working in the cached validation state."),
+    hls_only: bool = Query(False, description="Only channels marked HLS compatible in the cached validation state."),
+):
+    """
+    Stream the filtered channel list as an M3U playlist. Uses cached validation state only
+    (run /channels/validate-all first); no streams are probed on this path.
+    """
+    items = await _select_channels(q)
+    return StreamingResponse(
+        _stream_lines(items, lambda it: f"{_extinf_line(it)}\n{it['url']}", "#EXTM3U", working_only, hls_only),
+        media_type="audio/x-mpegurl",
+        headers={"Content-Disposition": 'attachment; filename="channels.m3u"'},
+    )
+
+
+@app.get("/api/v1/export.jsonl")
+async def export_jsonl(
+    q: Optional[str] = None,
+    working_only: bool = Query(True, description="Only channels marked working in the cached validation state."),
+    hls_only: bool = Query(False, description="Only channels marked HLS compatible in the cached validation state."),
+):
+    """
+    Stream the filtered channel list as JSON Lines (one Channel object per line).
+    Uses cached validation state only.
+    """
+    items = await _select_channels(q)
+    return StreamingResponse(
+        _stream_lines(items, lambda it: _to_channel(it).model_dump_json(), None, working_only, hls_only),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="channels.jsonl"'},
+    )
+
+
+# --- Logo proxy endpoint ---
+@app.get("/api/v1/logos/{logo_hash}")
+async def get_logo(logo_hash: str):
+    """
+    Serve a channel logo through the local disk cache. Channel responses carry the
+    matching path in `logo_url`; the content for a hash never changes, so it is immutable.
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", logo_hash):
+        raise HTTPException(status_code=404, detail="logo not found")
+    logo = await _get_logo(logo_hash)
+    if logo is None:
+        raise HTTPException(status_code=404, detail="logo not available", headers={"Cache-Control": "public, max-age=3600"})
+    data, content_type = logo
+    return Response(
+        content=data,
+        media_type=content_type,
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{logo_hash}"',
+            "X-Content-Type-Options": "nosniff",
+            # logos may be SVG; never let one run script if opened directly
+            "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'",
+        },
+    )
+
+
+# --- HLS relay endpoints ---
+@app.get("/api/v1/relay/p/{token}.m3u8")
+async def relay_playlist(token: str):
+    """
+    Rewritten master/media playlist for a relayed stream. Channel responses carry the
+    entry path in `relay_url` when HLS_RELAY_ENABLED is set.
+    """
+    url = await _relay_lookup(token) if HLS_RELAY_ENABLED else None
+    if url is None:
+        raise HTTPException(status_code=404, detail="relay playlist not found")
+    try:
+        text = await _relay_playlist(url)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=f"stream not eligible for relay: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"upstream error: {e}")
+    return Response(content=text, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/api/v1/relay/s/{token}")
+async def relay_segment(token: str):
+    """
+    Relayed segment (or key / init map). Served from the shared cache; concurrent viewers of an
+    uncached segment share one upstream download and receive bytes as they arrive.
+    """
+    url = _relay["urls"].get(token) if HLS_RELAY_ENABLED else None
+    if url is None:
+        raise HTTPException(status_code=404, detail="relay segment not found")
+    cached = _relay["segments"].get(url)
+    if cached:
+        _relay["segments"].move_to_end(url)
+        data, content_type = cached
+        return Response(content=data, media_type=content_type, headers={"Cache-Control": "public, max-age=3600"})
+
+    dl = _relay_segment_download(url)
+    async with dl["cond"]:
+        await dl["cond"].wait_for(lambda: dl["content_type"] is not None or dl["done"])
+    if dl["content_type"] is None:
+        raise HTTPException(status_code=502, detail=f"upstream error: {dl['error']}")
+    return StreamingResponse(_relay_stream(dl), media_type=dl["content_type"], headers={"Cache-Control": "public, max-age=3600"})
+
+
+# --- EPG endpoints ---
+@app.get("/api/v1/channels/{tvg_id}/epg", response_model=List[Programme])
+async def channel_epg(
+    tvg_id: str,
+    from_: Optional[datetime] = Query(None, alias="from", description="Start of the window (default: now)"),
+    to: Optional[datetime] = Query(None, description="End of the window (default: from + 24h)"),
+):
+    """Programmes for a channel overlapping [from, to), from the XMLTV sources in EPG_SOURCES."""
+    start_ts = _epoch(from_) if from_ else int(time.time())
+    end_ts = _epoch(to) if to else start_ts + 24 * 3600
+    if end_ts <= start_ts:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    return _epg_between(tvg_id, start_ts, end_ts)
+
+
+@app.get("/api/v1/epg/now-next")
+async def epg_now_next(ids: str = Query(..., description="Comma-separated tvg-ids")):
+    """Current and next programme for each requested tvg-id (null when unknown)."""
+    now = int(time.time())
+    out: Dict[str, Any] = {}
+    for tvg_id in [i.strip() for i in ids.split(",") if i.strip()][:500]:
+        cur, nxt = _epg_now_next(tvg_id, now)
+        out[tvg_id] = {
+            "now": cur.model_dump() if cur else None,
+            "next": nxt.model_dump() if nxt else None,
+        }
+    return out
+
+
+@app.post("/api/v1/epg/refresh")
+async def trigger_epg_refresh(force: bool = Query(False, description="Re-parse sources even if unchanged")):
+    if not EPG_SOURCES:
+        raise HTTPException(status_code=404, detail="no EPG sources configured (set EPG_SOURCES)")
+    if _epg["running"]:
+        raise HTTPException(status_code=409, detail="EPG refresh already running")
+    asyncio.create_task(refresh_epg(force=force))
+    return {"started": True, "started_at": datetime.utcnow().isoformat()}
+
+
+@app.get("/api/v1/epg/status")
+async def epg_status():
+    return {
+        "running": _epg["running"],
+        "last_refresh": _epg["last_refresh"],
+        "channels_indexed": len(_epg["index"]),
+        "sources": {
+            src: {k: v for k, v in meta.items() if k != "file"}
+            for src, meta in _epg["sources"].items()
+        },
+    }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tests import the API module as `main.app`, the same way uvicorn is pointed at it from Backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
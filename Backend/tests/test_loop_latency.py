@@ -0,0 +1,97 @@
+"""/channels/summary latency while the channel index is re-downloaded, parsed and merged."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from main import app as api
+
+CHANNELS = 60_000
+PLAYLISTS = 250
+PLAYLIST_ONLY_STREAMS = 20_000
+
+
+def _index_text() -> str:
+    lines = ["#EXTM3U"]
+    for i in range(CHANNELS):
+        lines.append(
+            f'#EXTINF:-1 tvg-id="ch{i % 40_000}.xx" tvg-name="Channel {i} HD" tvg-logo="https://logos.example/{i}.png" '
+            f'tvg-language="eng" tvg-country="US" group-title="Group {i % 50}",Channel {i} HD'
+        )
+        lines.append(f"https://streams.example/live/{i}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def _crawled_index():
+    """Playlist membership the way crawl_playlists leaves it: master urls plus playlist-only streams."""
+    playlists, streams = {}, {}
+    for p in range(PLAYLISTS):
+        urls = [f"https://streams.example/live/{i}/index.m3u8" for i in range(p, CHANNELS, PLAYLISTS // 5)]
+        extra = [f"https://extra.example/{p}/{j}.m3u8" for j in range(PLAYLIST_ONLY_STREAMS // PLAYLISTS)]
+        for u in extra:
+            streams[u] = {"id": None, "name": f"Extra {u}", "tvg_id": None, "url": u, "group": None,
+                          "language": None, "country": None, "tvg_logo": None, "tvg_name": None, "extinf_attrs": ""}
+        playlists[f"https://playlists.example/countries/{p}.m3u"] = {
+            "type": "country", "code": f"c{p}", "etag": None, "last_modified": None,
+            "urls": urls + extra, "fetched_at": None,
+        }
+    return playlists, streams
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    text = _index_text()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url == httpx.URL(api.CHANNEL_INDEX_URL):
+            return httpx.Response(200, text=text)
+        return httpx.Response(404)
+
+    transport = httpx.MockTransport(handler)
+    real_client = httpx.AsyncClient
+
+    class UpstreamClient(real_client):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("transport", transport)
+            super().__init__(*args, **kwargs)
+
+    playlists, streams = _crawled_index()
+    monkeypatch.setattr(api.httpx, "AsyncClient", UpstreamClient)
+    monkeypatch.setitem(api._playlist_index, "playlists", playlists)
+    monkeypatch.setitem(api._playlist_index, "streams", streams)
+    for key in ("items", "by_url", "master", "last_loaded", "mirror_groups", "mirror_best"):
+        monkeypatch.setitem(api._channels_cache, key, api._channels_cache.get(key))
+    monkeypatch.setitem(api._channels_cache, "lock", asyncio.Lock())
+    yield real_client
+    api._shutdown_executors()
+
+
+def test_summary_p99_stays_flat_during_refresh(upstream):
+    real_client = upstream
+
+    async def scenario():
+        await api._load_channels(force=True)
+        assert len(api._channels_cache["items"]) == CHANNELS + PLAYLIST_ONLY_STREAMS
+
+        latencies = []
+        async with real_client(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as c:
+            refresh = asyncio.create_task(api._load_channels(force=True))
+
+            async def poll():
+                # back-to-back requests, so one is always in flight when the loop stalls
+                while not refresh.done():
+                    t0 = time.perf_counter()
+                    r = await c.get("/api/v1/channels/summary")
+                    latencies.append(time.perf_counter() - t0)
+                    assert r.status_code == 200
+
+            await asyncio.gather(*(poll() for _ in range(4)))
+            await refresh
+        return latencies
+
+    latencies = sorted(asyncio.run(scenario()))
+    print(len(latencies), latencies[-5:])
+    assert len(latencies) >= 20
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    assert p99 < 0.1, f"summary p99 {p99 * 1000:.0f} ms during refresh"
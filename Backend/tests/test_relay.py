@@ -0,0 +1,134 @@
+"""HLS relay against a fake in-process HLS origin (httpx.MockTransport)."""
+import asyncio
+from collections import OrderedDict
+
+import httpx
+import pytest
+
+from main import app as api
+
+ORIGIN = "https://origin.example"
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000
+low/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1600000
+http://127.0.0.1:8080/secret.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXT-X-KEY:METHOD=AES-128,URI="key.bin"
+#EXTINF:6.0,
+seg0.ts
+#EXTINF:6.0,
+http://10.0.0.5/seg1.ts
+"""
+
+
+class FakeOrigin:
+    def __init__(self):
+        self.hits = {}
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.hits[path] = self.hits.get(path, 0) + 1
+        if request.url.host == "private.example":
+            return httpx.Response(200, text="#EXTM3U\n", headers={"content-type": "application/vnd.apple.mpegurl"})
+        if path == "/live/master.m3u8":
+            return httpx.Response(200, text=MASTER, headers={"content-type": "application/vnd.apple.mpegurl"})
+        if path == "/live/low/index.m3u8":
+            return httpx.Response(200, text=MEDIA, headers={"content-type": "application/vnd.apple.mpegurl"})
+        if path == "/live/big.m3u8":
+            return httpx.Response(200, content=b"#EXTM3U\n" + b"#" * (api.RELAY_PLAYLIST_MAX_BYTES + 1),
+                                  headers={"content-type": "application/vnd.apple.mpegurl"})
+        if path == "/live/low/seg0.ts":
+            return httpx.Response(200, content=b"\x47" * 188 * 100, headers={"content-type": "video/mp2t"})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    fake = FakeOrigin()
+
+    async def resolve(host):
+        return ["10.1.2.3"] if host == "private.example" else ["93.184.216.34"]
+
+    monkeypatch.setattr(api, "HLS_RELAY_ENABLED", True)
+    monkeypatch.setattr(api, "_resolve_host", resolve)
+    monkeypatch.setitem(api._relay, "transport", httpx.MockTransport(fake))
+    monkeypatch.setitem(api._relay, "client", None)
+    monkeypatch.setitem(api._relay, "urls", OrderedDict())
+    monkeypatch.setitem(api._relay, "playlists", {})
+    monkeypatch.setitem(api._relay, "segments", OrderedDict())
+    monkeypatch.setitem(api._relay, "segment_bytes", 0)
+    monkeypatch.setitem(api._relay, "host_checks", {})
+    return fake
+
+
+def _run(coro):
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            if api._relay["client"] is not None:
+                await api._relay["client"].aclose()
+    return asyncio.run(wrapper())
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test")
+
+
+def test_playlists_are_rewritten_and_segments_fetched_once(origin):
+    async def scenario():
+        master_path = api._relay_entry_path(f"{ORIGIN}/live/master.m3u8", {"hls_compatible": True})
+        async with _client() as c:
+            r = await c.get(master_path)
+            assert r.status_code == 200
+            lines = r.text.splitlines()
+            variant = lines[2]
+            assert variant.startswith("/api/v1/relay/p/") and variant.endswith(".m3u8")
+            # loopback variant is left as-is rather than proxied
+            assert lines[4] == "http://127.0.0.1:8080/secret.m3u8"
+
+            media = await c.get(variant)
+            assert media.status_code == 200
+            media_lines = media.text.splitlines()
+            key_line, seg_line, private_seg = media_lines[2], media_lines[4], media_lines[6]
+            assert 'URI="/api/v1/relay/s/' in key_line
+            assert seg_line.startswith("/api/v1/relay/s/")
+            assert private_seg == "http://10.0.0.5/seg1.ts"
+
+            first, second = await asyncio.gather(c.get(seg_line), c.get(seg_line))
+            third = await c.get(seg_line)
+        for resp in (first, second, third):
+            assert resp.status_code == 200
+            assert len(resp.content) == 188 * 100
+        assert origin.hits["/live/low/seg0.ts"] == 1
+
+    _run(scenario())
+
+
+def test_oversized_playlist_is_rejected(origin):
+    async def scenario():
+        path = api._relay_entry_path(f"{ORIGIN}/live/big.m3u8", {"hls_compatible": True})
+        async with _client() as c:
+            r = await c.get(path)
+        assert r.status_code == 409
+
+    _run(scenario())
+
+
+def test_hosts_resolving_to_private_addresses_are_refused(origin):
+    async def scenario():
+        path = api._relay_entry_path("http://private.example/live.m3u8", {"hls_compatible": True})
+        seg = "/api/v1/relay/s/" + api._relay_register("http://private.example/seg.ts")
+        async with _client() as c:
+            r = await c.get(path)
+            s = await c.get(seg)
+        assert r.status_code == 409
+        assert s.status_code == 502
+        assert origin.hits == {}
+
+    _run(scenario())
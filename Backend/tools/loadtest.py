@@ -0,0 +1,459 @@
+# tools/loadtest.py
+"""
+End-to-end load test for the IPTV API.
+
+Starts two local processes:
+  - a fake iptv-org upstream (synthetic index.m3u, country/subdivision/city/language
+    playlists, logos and a fleet of fake stream hosts with configurable latency/failures)
+  - the real FastAPI app (main.app) under uvicorn, with all of its outgoing HTTP
+    redirected to the fake upstream
+then replays a mix of the frontend's calls at a target RPS and reports per-endpoint
+p50/p95/p99 latency, error rate, API process RSS and upstream request counts.
+
+Run from Backend/:
+    python tools/loadtest.py --rps 50 --duration 60 --channels 10000 --json run.json
+
+Compare runs by keeping --seed and the upstream options fixed.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+IPTV_HOST = "iptv-org.github.io"
+LOGO_HOST = "logos.fake"
+
+DEFAULT_MIX = "channels=55,count=15,countries=10,languages=10,logos=9,validate_all=1"
+
+
+# -------------------------
+# Synthetic upstream data
+# -------------------------
+def _playlist_paths() -> Dict[str, List[str]]:
+    """Playlist paths (on iptv-org.github.io) the API knows from its local data files, by type."""
+    with open(os.path.join(DATA_DIR, "languages.json"), encoding="utf-8") as f:
+        languages = json.load(f).get("items", [])
+    with open(os.path.join(DATA_DIR, "countries.json"), encoding="utf-8") as f:
+        countries = json.load(f).get("items", [])
+    out: Dict[str, List[str]] = {"language": [], "country": [], "subdivision": [], "city": []}
+
+    def _add(t: str, url: Optional[str]) -> None:
+        if url and IPTV_HOST in url:
+            out[t].append(url.split(IPTV_HOST, 1)[1])
+
+    for it in languages:
+        _add("language", it.get("playlist_url"))
+    for c in countries:
+        _add("country", c.get("playlist_url"))
+        for city in c.get("cities") or []:
+            _add("city", city.get("playlist_url"))
+        for s in c.get("subdivisions") or []:
+            _add("subdivision", s.get("playlist_url"))
+            for city in s.get("cities") or []:
+                _add("city", city.get("playlist_url"))
+    return out
+
+
+def build_upstream(channels: int, stream_hosts: int, seed: int) -> Dict[str, Any]:
+    """
+    Deterministic synthetic catalogue: every channel gets a country, a language and sometimes
+    a subdivision/city playlist; every 5th channel is a mirror of the previous one (same tvg-id).
+    Only ~30% of index.m3u entries carry tvg-country, like the real index.
+    """
+    rnd = random.Random(seed)
+    paths = _playlist_paths()
+    members: Dict[str, List[int]] = {p: [] for ps in paths.values() for p in ps}
+    entries = []
+    for i in range(channels):
+        tvg_id = f"chan{i - 1 if i % 5 == 4 else i}.fake"
+        country = rnd.choice(paths["country"]) if paths["country"] else None
+        attrs = f'tvg-id="{tvg_id}" tvg-logo="http://{LOGO_HOST}/{i}.png" group-title="Group{i % 25}"'
+        if country and rnd.random() < 0.3:
+            attrs += f' tvg-country="{os.path.splitext(os.path.basename(country))[0]}"'
+        url = f"http://stream{i % stream_hosts}.fake/live/{i}.m3u8"
+        entries.append(f"#EXTINF:-1 {attrs},Channel {i}\n{url}\n")
+        if country:
+            members[country].append(i)
+        if paths["language"]:
+            members[rnd.choice(paths["language"])].append(i)
+        for t in ("subdivision", "city"):
+            if paths[t] and rnd.random() < 0.2:
+                members[rnd.choice(paths[t])].append(i)
+    playlists = {
+        path: "#EXTM3U\n" + "".join(entries[i] for i in idx)
+        for path, idx in members.items()
+    }
+    return {
+        "index": "#EXTM3U\n" + "".join(entries),
+        "playlists": playlists,
+        "etags": {path: '"' + hashlib.sha1(text.encode()).hexdigest()[:16] + '"' for path, text in playlists.items()},
+    }
+
+
+# -------------------------
+# Fake upstream server (runs in its own process)
+# -------------------------
+def make_upstream_app(args: argparse.Namespace):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import Response
+
+    data = build_upstream(args.channels, args.stream_hosts, args.seed)
+    rnd = random.Random(args.seed + 1)
+    dead = {i for i in range(args.channels) if rnd.random() < args.stream_fail_rate}
+    stats: Dict[str, int] = {}
+    upstream = FastAPI()
+
+    def _count(key: str) -> None:
+        stats[key] = stats.get(key, 0) + 1
+
+    @upstream.get("/__stats")
+    async def upstream_stats():
+        return stats
+
+    @upstream.api_route("/{path:path}", methods=["GET", "HEAD"])
+    async def serve(path: str, request: Request):
+        host = request.headers.get("x-upstream-host", "")
+        path = "/" + path
+        if host == IPTV_HOST:
+            if path == "/iptv/index.m3u":
+                _count("index")
+                return Response(data["index"], media_type="audio/x-mpegurl")
+            text = data["playlists"].get(path)
+            if text is None:
+                _count("playlist_404")
+                return Response(status_code=404)
+            etag = data["etags"][path]
+            if request.headers.get("if-none-match") == etag:
+                _count("playlist_304")
+                return Response(status_code=304, headers={"ETag": etag})
+            _count("playlist")
+            return Response(text, media_type="audio/x-mpegurl", headers={"ETag": etag})
+        if host == LOGO_HOST:
+            _count("logo")
+            await asyncio.sleep(args.stream_latency_ms / 1000.0)
+            return Response(b"\x89PNG\r\n\x1a\n" + b"\x00" * 512, media_type="image/png")
+        if host.endswith(".fake"):
+            _count("stream_" + request.method.lower())
+            await asyncio.sleep(rnd.expovariate(1000.0 / args.stream_latency_ms) if args.stream_latency_ms > 0 else 0)
+            try:
+                idx = int(os.path.splitext(os.path.basename(path))[0])
+            except ValueError:
+                idx = -1
+            if idx in dead or rnd.random() < args.stream_flaky_rate:
+                return Response(status_code=503 if idx not in dead else 404)
+            return Response(
+                "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000,CODECS=\"avc1.4d401f,mp4a.40.2\"\nlow.m3u8\n",
+                media_type="application/vnd.apple.mpegurl",
+            )
+        _count("unknown_host")
+        return Response(status_code=404)
+
+    return upstream
+
+
+def run_upstream(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    uvicorn.run(make_upstream_app(args), host="127.0.0.1", port=args.upstream_port, log_level="warning")
+
+
+# -------------------------
+# API under test (runs in its own process), outgoing HTTP redirected to the fake upstream
+# -------------------------
+class _UpstreamTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, upstream: str, **kwargs):
+        super().__init__(**kwargs)
+        self.upstream = httpx.URL(upstream)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.headers["X-Upstream-Host"] = request.url.host
+        request.url = request.url.copy_with(scheme=self.upstream.scheme, host=self.upstream.host, port=self.upstream.port)
+        return await super().handle_async_request(request)
+
+
+def run_api(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    sys.path.insert(0, BACKEND_DIR)
+    from main import app as api
+
+    upstream = f"http://127.0.0.1:{args.upstream_port}"
+    real_client = httpx.AsyncClient
+
+    class _RedirectingClient(real_client):
+        def __init__(self, *a, **kw):
+            kw["transport"] = _UpstreamTransport(upstream)
+            super().__init__(*a, **kw)
+
+    api.httpx.AsyncClient = _RedirectingClient
+    # keep crawl/logo caches out of the real data dir
+    scratch = tempfile.mkdtemp(prefix="iptv-loadtest-")
+    api.PLAYLIST_INDEX_FILE = os.path.join(scratch, "playlist_index.json")
+    api.LOGO_CACHE_DIR = os.path.join(scratch, "logos")
+    uvicorn.run(api.app, host="127.0.0.1", port=args.api_port, log_level="warning")
+
+
+# -------------------------
+# Load generator
+# -------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def _query_codes() -> List[str]:
+    return [os.path.splitext(os.path.basename(p))[0] for ps in _playlist_paths().values() for p in ps]
+
+
+async def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                r = await client.get(url)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+async def generate_load(args: argparse.Namespace, api_pid: int) -> Dict[str, Any]:
+    base = f"http://127.0.0.1:{args.api_port}"
+    rnd = random.Random(args.seed + 2)
+    mix = _parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    codes = _query_codes()
+    words = ["news", "sport", "music", "kids", "movie", "channel 1"]
+    logo_urls: List[str] = []
+    results: Dict[str, Dict[str, Any]] = {n: {"latencies": [], "errors": 0, "status": {}} for n in names}
+    rss_samples: List[float] = []
+    state = {"inflight": 0, "dropped": 0}
+
+    def _request(name: str):
+        if name == "channels":
+            params = {"page": rnd.choice([1, 1, 1, 2, 3]), "limit": 24, "validate": "true"}
+            roll = rnd.random()
+            if roll < 0.4:
+                params["q"] = rnd.choice(codes)
+            elif roll < 0.6:
+                params["q"] = rnd.choice(words)
+            if rnd.random() < 0.2:
+                params["working_only"] = "false"
+            return "GET", "/api/v1/channels", params
+        if name == "count":
+            return "GET", "/api/v1/channels/count", ({"q": rnd.choice(codes)} if rnd.random() < 0.5 else {})
+        if name == "countries":
+            return "GET", "/api/v1/countries", {}
+        if name == "languages":
+            return "GET", "/api/v1/languages", {}
+        if name == "logos" and logo_urls:
+            return "GET", rnd.choice(logo_urls), {}
+        if name == "validate_all":
+            return "POST", "/api/v1/channels/validate-all", {}
+        return "GET", "/api/v1/channels/summary", {}
+
+    async def _one(client: httpx.AsyncClient, name: str) -> None:
+        method, path, params = _request(name)
+        res = results[name]
+        started = time.perf_counter()
+        try:
+            r = await client.request(method, path, params=params)
+            status = r.status_code
+            if name == "channels" and status == 200:
+                logo_urls.extend(ch["logo_url"] for ch in r.json() if ch.get("logo_url"))
+                del logo_urls[:-2000]
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        res["latencies"].append(time.perf_counter() - started)
+        res["status"][str(status)] = res["status"].get(str(status), 0) + 1
+        # validate-all answers 409 while a run is in progress: expected, not an error
+        if not isinstance(status, int) or (status >= 400 and not (name == "validate_all" and status == 409)):
+            res["errors"] += 1
+
+    async def _tracked(client: httpx.AsyncClient, name: str) -> None:
+        state["inflight"] += 1
+        try:
+            await _one(client, name)
+        finally:
+            state["inflight"] -= 1
+
+    async def _sample_rss() -> None:
+        while True:
+            rss = _rss_mb(api_pid)
+            if rss is not None:
+                rss_samples.append(rss)
+            await asyncio.sleep(1.0)
+
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(base_url=base, timeout=args.request_timeout, limits=limits) as client:
+        sampler = asyncio.create_task(_sample_rss())
+        tasks = set()
+        interval = 1.0 / args.rps
+        started = time.monotonic()
+        n = 0
+        while time.monotonic() - started < args.duration:
+            # open loop: requests are issued on schedule regardless of response times
+            target = started + n * interval
+            delay = target - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            n += 1
+            if state["inflight"] >= args.max_inflight:
+                state["dropped"] += 1
+                continue
+            t = asyncio.create_task(_tracked(client, rnd.choices(names, weights)[0]))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks, timeout=args.request_timeout)
+        elapsed = time.monotonic() - started
+        sampler.cancel()
+        summary = (await client.get("/api/v1/channels/summary")).json()
+
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        upstream_stats = (await client.get(f"http://127.0.0.1:{args.upstream_port}/__stats")).json()
+
+    endpoints = {}
+    for name, res in results.items():
+        lat = sorted(res["latencies"])
+        count = len(lat)
+        endpoints[name] = {
+            "requests": count,
+            "p50_ms": round(_percentile(lat, 50) * 1000, 1) if lat else None,
+            "p95_ms": round(_percentile(lat, 95) * 1000, 1) if lat else None,
+            "p99_ms": round(_percentile(lat, 99) * 1000, 1) if lat else None,
+            "error_rate": round(res["errors"] / count, 4) if count else None,
+            "status": res["status"],
+        }
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("func",)},
+        "elapsed_s": round(elapsed, 2),
+        "issued": n,
+        "dropped": state["dropped"],
+        "achieved_rps": round(sum(e["requests"] for e in endpoints.values()) / elapsed, 2),
+        "endpoints": endpoints,
+        "rss_mb": {
+            "start": round(rss_samples[0], 1) if rss_samples else None,
+            "peak": round(max(rss_samples), 1) if rss_samples else None,
+            "end": round(rss_samples[-1], 1) if rss_samples else None,
+        },
+        "upstream_requests": upstream_stats,
+        "api_summary": summary,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\nissued {report['issued']} requests in {report['elapsed_s']}s "
+          f"({report['achieved_rps']} rps completed, {report['dropped']} dropped at max-inflight)")
+    print(f"{'endpoint':<14}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for name, e in report["endpoints"].items():
+        err = f"{e['error_rate'] * 100:.1f}%" if e["error_rate"] is not None else "-"
+        print(f"{name:<14}{e['requests']:>9}{e['p50_ms'] or '-':>10}{e['p95_ms'] or '-':>10}{e['p99_ms'] or '-':>10}{err:>9}")
+    rss = report["rss_mb"]
+    print(f"API RSS MB: start {rss['start']}  peak {rss['peak']}  end {rss['end']}")
+    print("upstream requests: " + ", ".join(f"{k}={v}" for k, v in sorted(report["upstream_requests"].items())))
+
+
+def run_load(args: argparse.Namespace) -> None:
+    args.upstream_port = args.upstream_port or _free_port()
+    args.api_port = args.api_port or _free_port()
+    common = [
+        "--seed", str(args.seed), "--channels", str(args.channels), "--stream-hosts", str(args.stream_hosts),
+        "--stream-latency-ms", str(args.stream_latency_ms), "--stream-fail-rate", str(args.stream_fail_rate),
+        "--stream-flaky-rate", str(args.stream_flaky_rate),
+        "--upstream-port", str(args.upstream_port), "--api-port", str(args.api_port),
+    ]
+    script = os.path.abspath(__file__)
+    procs = []
+    try:
+        procs.append(subprocess.Popen([sys.executable, script, "upstream"] + common))
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.upstream_port}/__stats", 60))
+        api_proc = subprocess.Popen([sys.executable, script, "api"] + common, cwd=BACKEND_DIR)
+        procs.append(api_proc)
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.api_port}/api/v1/channels/summary", 120))
+        report = asyncio.run(generate_load(args, api_proc.pid))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {args.json}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", nargs="?", default="run", choices=["run", "upstream", "api"],
+                        help="run (default) starts everything; upstream/api are used internally")
+    parser.add_argument("--rps", type=float, default=20.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--channels", type=int, default=5000, help="channels in the synthetic index.m3u")
+    parser.add_argument("--stream-hosts", type=int, default=50, help="distinct fake stream hosts")
+    parser.add_argument("--stream-latency-ms", type=float, default=80.0, help="mean fake stream response latency")
+    parser.add_argument("--stream-fail-rate", type=float, default=0.3, help="fraction of streams that are dead")
+    parser.add_argument("--stream-flaky-rate", type=float, default=0.02, help="per-request failure rate for live streams")
+    parser.add_argument("--max-inflight", type=int, default=500, help="outstanding requests before new ones are dropped")
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--upstream-port", type=int, default=0)
+    parser.add_argument("--api-port", type=int, default=0)
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+    if args.mode == "upstream":
+        run_upstream(args)
+    elif args.mode == "api":
+        run_api(args)
+    else:
+        run_load(args)
+
+
+if __name__ == "__main__":
+    main()
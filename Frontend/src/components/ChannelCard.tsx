@@ -1,4 +1,5 @@
 import { useMemo, useState } from "react";
+import { API_BASE } from "../lib/api";
 
 export default function ChannelCard({
   channel,
@@ -11,9 +12,11 @@ export default function ChannelCard({
 }) {
   const [logoError, setLogoError] = useState(false);
   const logoSrc: string | null = useMemo(() => {
+    // prefer the backend's cached logo proxy over hitting third-party hosts directly
+    if (channel.logo_url) return `${API_BASE}${channel.logo_url}`;
     const src = channel.tvg_logo || channel.logo || null;
     return src || null;
-  }, [channel?.tvg_logo, channel?.logo]);
+  }, [channel?.logo_url, channel?.tvg_logo, channel?.logo]);
 
   const cardCls = [
     "ui-card group cursor-pointer overflow-hidden flex flex-col",